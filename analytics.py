@@ -1,13 +1,20 @@
 import database
-import pandas as pd
-import plotly.express as px
 
 
-def recommend_study_topic(user_id):
+def recommend_study_topic(user_id, mastery=None):
     """
-    Looks at the UserSkills profile and returns the lowest scoring topic.
+    Returns the skill the student is least likely to have mastered according to knowledge
+    tracing (`mastery`, see knowledge.KnowledgeTracer), or without that evidence the
+    lowest scoring topic of the UserSkills profile.
+    Skills with no attempts yet only carry the fitted prior, so they rank together at
+    the lowest such prior and the profile's XP orders them (and breaks any other tie).
     """
     skills = database.get_user_skills(user_id)
+    if mastery:
+        observed = database.get_mastery(user_id)
+        untried = min((p for skill, p in mastery.items() if skill not in observed), default=None)
+        return min(mastery, key=lambda skill: (observed.get(skill, untried), (skills or {}).get(skill, 0)))
+
     if not skills:
         return None
 
@@ -15,40 +22,45 @@ def recommend_study_topic(user_id):
     return weakest_topic
 
 
-def generate_progress_chart(user_id):
-    """Generates a line chart of skill progression over sessions."""
+def rebuild_progress(user_id):
+    """
+    Recomputes the user's skill_progress rows from the full attempt history,
+    one vectorized group-by over the rewarded attempts. Returns the number of sessions.
+    """
     raw_data = database.get_user_progress_data(user_id)
-    if not raw_data: return None
+    snapshots = []
+    if raw_data:
+        import pandas as pd
 
-    # Reconstruct score history
-    history = []
-    current_scores = {"Loops": 0.0, "Recursion": 0.0, "Syntax": 0.0, "Logic": 0.0, "Data_Structures": 0.0}
+        df = pd.DataFrame([{"session_id": e["session_id"], "started_at": e["timestamp"], **e["rewards"]}
+                           for e in raw_data if e["rewards"]])
+        if not df.empty:
+            skills = list(database.SKILL_COLUMNS)
+            df = df.reindex(columns=["session_id", "started_at", *skills]).fillna({s: 0.0 for s in skills})
+            grouped = df.groupby("session_id", sort=False).agg(
+                started_at=("started_at", "min"), **{s: (s, "sum") for s in skills})
+            snapshots = grouped.reset_index().to_dict("records")
 
-    # Add initial state
-    history.append({"Session": "Start", **current_scores.copy()})
+    database.replace_progress_snapshots(user_id, snapshots)
+    return len(snapshots)
 
-    seen_sessions = {}
-    session_counter = 0
 
-    for entry in raw_data:
-        sid = entry['session_id']
-        if sid not in seen_sessions:
-            session_counter += 1
-            seen_sessions[sid] = f"S{session_counter}"
+def generate_progress_chart(user_id):
+    """Generates a line chart of skill progression over sessions (one point per rewarded session)."""
+    snapshots = database.get_progress_snapshots(user_id)
+    if not snapshots: return None
 
-        # Accumulate scores
-        for skill, points in entry['rewards'].items():
-            if skill in current_scores:
-                current_scores[skill] += points
+    import pandas as pd
+    import plotly.express as px
 
-        # Snapshot current state
-        snapshot = current_scores.copy()
-        snapshot["Session"] = seen_sessions[sid]
-        history.append(snapshot)
+    skills = list(database.SKILL_COLUMNS)
+    df = pd.DataFrame(snapshots, columns=skills)
 
-    df = pd.DataFrame(history)
+    # Running totals, starting from zero
+    df = pd.concat([pd.DataFrame([[0.0] * len(skills)], columns=skills), df.cumsum()], ignore_index=True)
+    df.insert(0, "Session", ["Start"] + [f"S{i}" for i in range(1, len(snapshots) + 1)])
     df_melted = df.melt('Session', var_name='Skill', value_name='Score')
 
     fig = px.line(df_melted, x='Session', y='Score', color='Skill', markers=True)
     fig.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", font=dict(color="white"))
-    return fig
\ No newline at end of file
+    return fig
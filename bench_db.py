@@ -0,0 +1,133 @@
+"""
+Concurrent writer/reader benchmark for the SQLite profile in database.py.
+
+Writer threads log attempts (like students submitting fixes) while reader
+threads load dashboards, on a throwaway database. Runs once with SQLite's
+defaults and once with database.SQLITE_PRAGMAS, and reports throughput,
+p50/p95 latency and "database is locked" errors for each.
+
+    python bench_db.py --writers 8 --readers 8 --seconds 10
+    python bench_db.py --profile tuned --write-behind   # batched attempt logging
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import database
+
+PROFILES = {
+    "default": ({}, 5, 10),  # pragmas, pool size, max overflow (SQLAlchemy's defaults)
+    "tuned": (dict(database.SQLITE_PRAGMAS), database.SQLITE_POOL_SIZE, database.SQLITE_MAX_OVERFLOW),
+}
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def use_profile(name, path):
+    if database.engine is not None:
+        database.engine.dispose()
+        database.engine = None
+    database.DB_NAME = path
+    database.SQLITE_PRAGMAS, database.SQLITE_POOL_SIZE, database.SQLITE_MAX_OVERFLOW = PROFILES[name]
+    database.get_engine()
+
+
+def seed(users, attempts_per_user):
+    user_ids = []
+    for i in range(users):
+        database.register_user(f"bench_{i}", "pw", f"Bench {i}")
+        user_ids.append(database.login_user(f"bench_{i}", "pw")["id"])
+    with database.unit_of_work():
+        for uid in user_ids:
+            for j in range(attempts_per_user):
+                database.log_attempt(uid, f"ERR_{j % 50:03d}", "x = 1", j % 3 == 0,
+                                     session_id=f"{uid}-{j // 5}", rewards={"Loops": 1.0} if j % 3 == 0 else None)
+    return user_ids
+
+
+def worker(action, user_ids, stop, latencies, errors, think=0.0):
+    rng = random.Random()
+    while not stop.is_set():
+        uid = rng.choice(user_ids)
+        start = time.perf_counter()
+        try:
+            action(uid, rng)
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(type(e).__name__ + (": locked" if "locked" in str(e) else ""))
+        if think:
+            stop.wait(rng.expovariate(1 / think))
+
+
+def write(uid, rng):
+    database.log_attempt(uid, f"ERR_{rng.randrange(50):03d}", "x = 2", rng.random() < 0.3,
+                         session_id=f"{uid}-live", rewards={"Logic": 0.5})
+
+
+def read(uid, rng):
+    with database.unit_of_work(uid):
+        database.get_user_skills(uid)
+        database.get_user_stats(uid)
+        database.get_user_sessions_page(uid)
+
+
+def run(name, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        use_profile(name, os.path.join(tmp, "bench.db"))
+        user_ids = seed(args.users, args.attempts)
+
+        stop = threading.Event()
+        results = {"write": ([], []), "read": ([], [])}
+        threads = [threading.Thread(target=worker, args=(write, user_ids, stop, *results["write"], args.think))
+                   for _ in range(args.writers)]
+        threads += [threading.Thread(target=worker, args=(read, user_ids, stop, *results["read"]))
+                    for _ in range(args.readers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        if database.get_attempt_buffer():
+            database.get_attempt_buffer().flush()
+        database.engine.dispose()
+        database.engine = None
+
+    print(f"\n{name} profile{' + write-behind' if database.WRITE_BEHIND else ''}")
+    for kind, (latencies, errors) in results.items():
+        print(f"  {kind:<6} {len(latencies) / args.seconds:8.1f} ops/s  "
+              f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+              f"errors {len(errors)}" + (f" ({errors[0]})" if errors else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent attempt logging and dashboard reads.")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=100, help="Seeded attempts per user")
+    parser.add_argument("--profile", choices=["both", *PROFILES], default="both")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="Mean seconds a writer waits between attempts (0 = as fast as possible)")
+    parser.add_argument("--write-behind", action="store_true", help="Buffer log_attempt and write in batches")
+    args = parser.parse_args()
+    database.WRITE_BEHIND = args.write_behind
+
+    for name in (PROFILES if args.profile == "both" else [args.profile]):
+        run(name, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark for the knowledge-tracing fit in knowledge.py.
+
+Simulates students from known parameters, fits them back with knowledge.fit_em
+and reports fit time, attempts per second, time per EM iteration and how close
+the recovered parameters are, for growing attempt tables. Runs on one CPU core
+(BLAS / OpenMP threads are pinned to 1). Also times the online update.
+
+The EM loop runs once per step of the longest sequence, so --heavy-tail draws
+Pareto lengths (same mean, a few students with thousands of attempts) as well.
+
+    python bench_knowledge.py --attempts 100000 1000000 5000000 --heavy-tail
+"""
+import os
+
+for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ[var] = "1"
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import knowledge
+
+TRUE_PARAMS = {"p_init": 0.3, "p_learn": 0.1, "p_guess": 0.2, "p_slip": 0.08}
+
+
+def simulate(attempts, mean_length, params, seed=0, heavy_tail=False):
+    """
+    (seq, correct) for students with geometric sequence lengths (or Pareto ones
+    with the same mean if `heavy_tail`), about `attempts` in total.
+    """
+    rng = np.random.default_rng(seed)
+    size = int(attempts / mean_length) + 1
+    if heavy_tail:
+        # Lomax with shape 1.5 has mean 2 * scale and unbounded variance
+        lengths = 1 + (rng.pareto(1.5, size=size) * (mean_length - 1) / 2).astype(int)
+    else:
+        lengths = rng.geometric(1 / mean_length, size=size)
+    lengths = lengths[np.cumsum(lengths) <= attempts] if lengths.sum() > attempts else lengths
+    seq = np.repeat(np.arange(len(lengths)), lengths)
+    step = np.arange(len(seq)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # Each student learns after a geometric number of attempts (or already knows it)
+    learned_after = rng.geometric(params["p_learn"], size=len(lengths))
+    learned_after[rng.random(len(lengths)) < params["p_init"]] = 0
+    known = step >= learned_after[seq]
+    u = rng.random(len(seq))
+    correct = np.where(known, u >= params["p_slip"], u < params["p_guess"])
+    return seq, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the knowledge-tracing EM fit.")
+    parser.add_argument("--attempts", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--mean-length", type=float, default=20.0, help="Mean attempts per student and skill")
+    parser.add_argument("--iterations", type=int, default=knowledge.config.KT_EM_ITERATIONS)
+    parser.add_argument("--heavy-tail", action="store_true", help="Also run with Pareto sequence lengths")
+    args = parser.parse_args()
+
+    print(f"{'lengths':>9} {'attempts':>10} {'students':>9} {'longest':>8} {'iters':>5} {'fit s':>8} "
+          f"{'ms/iter':>8} {'attempts/s':>11}  max |error|")
+    for heavy_tail in (False, True) if args.heavy_tail else (False,):
+        for n in args.attempts:
+            seq, correct = simulate(n, args.mean_length, TRUE_PARAMS, heavy_tail=heavy_tail)
+            started = time.perf_counter()
+            params, _, iterations = knowledge.fit_em(seq, correct, iterations=args.iterations)
+            took = time.perf_counter() - started
+
+            error = max(abs(params[k] - TRUE_PARAMS[k]) for k in TRUE_PARAMS)
+            longest = np.bincount(seq).max()
+            print(f"{'pareto' if heavy_tail else 'geometric':>9} {len(seq):>10} {seq[-1] + 1:>9} {longest:>8} "
+                  f"{iterations:>5} {took:>8.2f} {took / iterations * 1000:>8.1f} "
+                  f"{len(seq) * iterations / took:>11,.0f}  {error:.3f}")
+
+    updates = 200_000
+    started = time.perf_counter()
+    p_known = TRUE_PARAMS["p_init"]
+    for i in range(updates):
+        p_known = knowledge.update(p_known, i % 3 != 0, TRUE_PARAMS)
+    print(f"\nOnline update: {(time.perf_counter() - started) / updates * 1e6:.2f} µs per attempt")
+
+
+if __name__ == "__main__":
+    main()
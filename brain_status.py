@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import config
+
+
+def key_id(key):
+    """Stable identifier for an API key that is safe to write to disk."""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError):
+        pass  # No permission to signal it (so it exists), or no pid recorded
+    return True
+
+
+class BrainProbe:
+    """
+    Probes the Gemini keys on a background thread so startup never waits on
+    the network. The result (and each key's model list) is shared with other
+    processes through a small JSON status file, so a fresh worker adopts it
+    instead of probing again until it expires.
+
+    `probe()` is the blocking check and returns (ok, model_name, {key: models}).
+    A shared result only counts for the same set of `keys`.
+    """
+
+    def __init__(self, probe, keys, path=config.BRAIN_STATUS_PATH, ttl=config.BRAIN_STATUS_TTL,
+                 offline_ttl=config.BRAIN_OFFLINE_TTL, probe_timeout=config.BRAIN_PROBE_TIMEOUT):
+        self.probe = probe
+        self.keys_id = key_id(",".join(sorted(k for k in keys if isinstance(k, str))))
+        self.path = path
+        self.ttl = ttl
+        self.offline_ttl = offline_ttl
+        self.probe_timeout = probe_timeout
+
+        self.state = "checking"  # checking | online | offline
+        self.model_name = None
+        self.checked_at = None
+        self._models = {}  # key id -> model names
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def status(self):
+        return self.state, self.model_name
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def models_for(self, key):
+        """Model list for a key from the last probe, or None."""
+        return self._models.get(key_id(key))
+
+    def start(self):
+        """Adopts a fresh shared result, or starts probing in the background."""
+        saved = self._read()
+        if saved and self._is_fresh(saved):
+            self._adopt(saved)
+            print(f"✅ Brain status from cache: {self.state}")
+            return
+        threading.Thread(target=self._run, args=(saved,), name="brain-probe", daemon=True).start()
+
+    def refresh(self):
+        """Probes again now, ignoring the shared result."""
+        if self._done.is_set():
+            self._done.clear()
+            self.state = "checking"
+            threading.Thread(target=self._run, args=(None,), name="brain-probe", daemon=True).start()
+
+    def _is_fresh(self, saved):
+        if saved.get("keys_id") != self.keys_id or saved.get("state") not in ("online", "offline"):
+            return False
+        ttl = self.ttl if saved["state"] == "online" else self.offline_ttl
+        return time.time() - saved.get("checked_at", 0) < ttl
+
+    def _run(self, saved):
+        # Another process is already probing: wait for its result instead of repeating it
+        if (saved and saved.get("state") == "checking" and saved.get("keys_id") == self.keys_id
+                and time.time() - saved.get("started_at", 0) < self.probe_timeout):
+            deadline = saved["started_at"] + self.probe_timeout
+            while time.time() < deadline and pid_alive(saved.get("pid")):
+                time.sleep(0.5)
+                saved = self._read() or {}
+                if self._is_fresh(saved):
+                    self._adopt(saved)
+                    return
+
+        self._write({"state": "checking", "keys_id": self.keys_id, "started_at": time.time(), "pid": os.getpid()})
+        try:
+            ok, model_name, models = self.probe()
+        except Exception as e:
+            print(f"❌ Brain probe failed: {e}")
+            ok, model_name, models = False, None, {}
+
+        result = {
+            "state": "online" if ok else "offline",
+            "keys_id": self.keys_id,
+            "model_name": model_name,
+            "checked_at": time.time(),
+            "models": {key_id(k): v for k, v in models.items()},
+        }
+        self._write(result)
+        self._adopt(result)
+
+    def _adopt(self, saved):
+        with self._lock:
+            self._models = saved.get("models", {})
+            self.model_name = saved.get("model_name")
+            self.checked_at = saved.get("checked_at")
+            self.state = saved["state"]
+        self._done.set()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, data):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not write brain status: {e}")
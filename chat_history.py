@@ -0,0 +1,78 @@
+import hashlib
+import config
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def format_turns(messages):
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def fingerprint(messages):
+    return hashlib.sha1(format_turns(messages).encode()).hexdigest()
+
+
+def extractive_summary(previous_summary, turns, max_tokens=config.CHAT_SUMMARY_MAX_TOKENS):
+    """Offline fallback: keeps the start of each user turn, trimmed to the summary budget."""
+    notes = [f"User asked: {m['content'][:80]}" for m in turns if m["role"] == "user"]
+    text = " ".join(filter(None, [previous_summary] + notes))
+    return text[-max_tokens * 4:]
+
+
+class ChatHistory:
+    """
+    Builds the chat history part of the tutor prompt within a token budget.
+    The last turns are kept verbatim; older turns are folded into a rolling
+    summary. Folding happens in steps of `fold_step` turns, so the summary is
+    only recomputed when the window actually moves.
+    """
+
+    def __init__(self, summarize,
+                 token_budget=config.CHAT_HISTORY_TOKEN_BUDGET,
+                 keep_last=config.CHAT_KEEP_LAST_TURNS,
+                 fold_step=config.CHAT_FOLD_STEP):
+        # summarize(previous_summary, new_turns) -> str
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.keep_last = keep_last
+        self.fold_step = fold_step
+
+    def fold_point(self, messages):
+        """Number of leading messages that go into the summary."""
+        overflow = len(messages) - self.keep_last
+        cut = (overflow // self.fold_step) * self.fold_step if overflow > 0 else 0
+
+        # Very long recent turns: fold further until the verbatim part fits the budget
+        while cut + 1 < len(messages) and estimate_tokens(format_turns(messages[cut:])) > self.token_budget:
+            cut = min(cut + self.fold_step, len(messages) - 1)
+        return cut
+
+    def build(self, messages, cache):
+        """
+        Returns the history text for the prompt.
+        `cache` is a per-chat dict (e.g. in st.session_state) holding the rolling summary.
+        """
+        cut = self.fold_point(messages)
+        if cut == 0:
+            return format_turns(messages)
+
+        summary = self._summary_upto(messages, cut, cache)
+        return f"Summary of earlier conversation: {summary}\n{format_turns(messages[cut:])}"
+
+    def _summary_upto(self, messages, cut, cache):
+        folded_fp = fingerprint(messages[:cut])
+        if cache.get("upto") == cut and cache.get("fingerprint") == folded_fp:
+            return cache["text"]
+
+        # Extend the previous summary if it still describes a prefix of this chat
+        prev_upto = cache.get("upto", 0)
+        if 0 < prev_upto < cut and cache.get("fingerprint") == fingerprint(messages[:prev_upto]):
+            text = self.summarize(cache["text"], messages[prev_upto:cut])
+        else:
+            text = self.summarize("", messages[:cut])
+
+        cache.update(upto=cut, fingerprint=folded_fp, text=text)
+        return text
@@ -0,0 +1,87 @@
+"""
+Import-time budget for the app's modules.
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+fails (exit code 1) if it takes longer than its budget, pulls in one of the
+heavy libraries that must stay lazy, or opens the database. The time checked
+is the best of several cold imports, so a loaded machine doesn't fail it at random.
+
+    python check_import_time.py            # check every budget
+    python check_import_time.py --top 15   # also list the slowest imports
+    python check_import_time.py --runs 9   # more runs per module (default 5)
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+HEAVY = ["torch", "sentence_transformers", "transformers", "plotly"]
+
+# module -> (budget in ms, libraries it must not import)
+# (retriever and ui_logic include streamlit via config; ui_logic also the Gemini SDK)
+BUDGETS = {
+    "database": (400, HEAVY + ["pandas"]),
+    "analytics": (450, HEAVY + ["pandas"]),
+    "retriever": (1500, HEAVY + ["pandas"]),
+    "ui_logic": (4000, HEAVY),
+}
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module):
+    """Returns ({imported module: cumulative µs}, created_db) for a cold import of `module`."""
+    with tempfile.TemporaryDirectory() as cwd:
+        # Run from an empty directory so a database created by the import would show up there
+        env = dict(os.environ, PYTHONPATH=BASE_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=cwd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+        created_db = os.path.exists(os.path.join(cwd, "tutor.db"))
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2))
+    return timings, created_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the app's modules.")
+    parser.add_argument("--top", type=int, default=0, help="Also list the N slowest imports per module")
+    parser.add_argument("--runs", type=int, default=5, help="Cold imports per module; the fastest is checked")
+    args = parser.parse_args()
+
+    failures = []
+    for module, (budget_ms, forbidden) in BUDGETS.items():
+        runs = [measure(module) for _ in range(max(1, args.runs))]
+        timings, _ = min(runs, key=lambda run: run[0].get(module, 0))
+        created_db = any(created for _, created in runs)
+        took_ms = timings.get(module, 0) / 1000
+        heavy = sorted(m for m in timings if m.split(".")[0] in forbidden)
+
+        ok = took_ms <= budget_ms and not heavy and not created_db
+        print(f"{'✅' if ok else '❌'} {module:<10} {took_ms:8.1f} ms  (budget {budget_ms} ms)")
+        if took_ms > budget_ms:
+            failures.append(f"{module}: {took_ms:.0f} ms is over the {budget_ms} ms budget")
+        if heavy:
+            failures.append(f"{module}: imports {', '.join(sorted({m.split('.')[0] for m in heavy}))} eagerly")
+        if created_db:
+            failures.append(f"{module}: opens the database at import")
+
+        if args.top:
+            for name, us in sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+                print(f"     {us / 1000:8.1f} ms  {name}")
+
+    for failure in failures:
+        print(f"  ❌ {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
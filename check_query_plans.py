@@ -0,0 +1,86 @@
+"""
+Query-plan check for the attempts and skill_progress tables.
+
+Builds a throwaway database, calls the database helpers the app uses and
+runs EXPLAIN QUERY PLAN on every query they send that reads those tables.
+Fails (exit code 1) if any of them scans the table without an index.
+
+    python check_query_plans.py          # check
+    python check_query_plans.py --show   # also print every plan
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+TABLES = ("attempts", "skill_progress")
+
+
+def captured_queries(database):
+    """Runs the read helpers on a small dataset and returns the (sql, params) they executed."""
+    from sqlalchemy import event
+
+    database.register_user("plan_check", "pw", "Plan Check")
+    user_id = database.login_user("plan_check", "pw")["id"]
+    for i in range(20):
+        database.log_attempt(user_id, f"ERR_{i % 5:03d}", f"x = {i}", i % 3 == 0,
+                             session_id=f"s{i % 4}", rewards={"Loops": 1.0} if i % 3 == 0 else None)
+
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if any(t in statement for t in TABLES) and statement.lstrip().upper().startswith("SELECT"):
+            queries.append((statement, parameters))
+
+    event.listen(database.get_engine(), "before_cursor_execute", capture)
+    database.get_user_stats(user_id)
+    database.get_user_history(user_id)
+    database.get_last_unfinished(user_id)
+    database.get_last_attempt_id(user_id)
+    _, cursor = database.get_user_sessions_page(user_id, limit=2)
+    database.get_user_sessions_page(user_id, before=cursor, limit=2)
+    database.get_session_history("s1")
+    database.get_user_progress_data(user_id)
+    database.get_progress_snapshots(user_id)
+    database.get_reward_totals(user_id)
+    rows = database.get_attempts_after(0, 5)
+    database.get_sessions_attempts({r.session_id for r in rows}, rows[-1].id)
+    event.remove(database.get_engine(), "before_cursor_execute", capture)
+    return queries
+
+
+def full_scans(plan):
+    # "SCAN <table>" without "USING ... INDEX" reads every row
+    return [row for row in plan if row.startswith(tuple(f"SCAN {t}" for t in TABLES)) and "INDEX" not in row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that attempts / skill_progress queries use an index.")
+    parser.add_argument("--show", action="store_true", help="Print every query plan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        os.chdir(cwd)  # database.DB_NAME is relative, so the throwaway DB lands here
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import database
+
+        failures = 0
+        with database.get_engine().connect() as conn:
+            for sql, params in captured_queries(database):
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)]
+                scans = full_scans(plan)
+                failures += bool(scans)
+
+                if scans or args.show:
+                    print(f"{'❌' if scans else '✅'} {' '.join(sql.split())[:110]}")
+                    for row in plan:
+                        print(f"     {row}")
+
+        database.get_engine().dispose()
+
+    print(f"\n{'❌' if failures else '✅'} {failures} queries scan a table without an index.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+import config
+import database
+
+SCOPES = ("snippet", "error_type")
+
+# Upper bounds of the "to solve" histogram buckets (the last bucket is open-ended)
+BUCKETS = {
+    "attempts": (1, 2, 3, 4, 5, 7, 10, 15, 20),
+    "seconds": (30, 60, 120, 300, 600, 1200, 1800, 3600),
+}
+
+# Snippet ids that aren't a snippet from the database (the student's own code)
+UNTRACKED_SNIPPETS = {"USER_INPUT", None}
+
+
+def attempt_keys(row):
+    """(scope, key) pairs an attempt counts towards."""
+    keys = []
+    if row.snippet_id not in UNTRACKED_SNIPPETS:
+        keys.append(("snippet", row.snippet_id))
+    if row.error_type:
+        keys.append(("error_type", row.error_type))
+    return keys
+
+
+def batch_deltas(last_id, rows, history):
+    """
+    Cohort deltas for one batch of attempts (`rows`, the ids after `last_id`, in id order).
+    `history` holds every attempt, up to the batch's last id, of the sessions with a success
+    in the batch. A session counts as solved, once, at its first success: attempts to solve
+    are its fix attempts (those with a snippet or an error type) up to then, time to solve
+    runs from the session's first attempt.
+    Returns (stats, buckets) as database.save_cohort_batch takes them.
+    """
+    stats = {}
+    for row in rows:
+        for key in attempt_keys(row):
+            s = stats.setdefault(key, {"attempts": 0, "successes": 0, "solved": 0})
+            s["attempts"] += 1
+            s["successes"] += bool(row.is_success)
+
+    sessions = {}
+    for row in history:
+        sessions.setdefault(row.session_id, []).append(row)
+
+    buckets = {}
+    for attempts in sessions.values():
+        first = next((a for a in attempts if a.is_success), None)
+        if first is None or first.id <= last_id:
+            continue  # Solved in an earlier batch
+
+        tries = sum(1 for a in attempts if a.id <= first.id and attempt_keys(a)) or 1
+        seconds = (first.timestamp - attempts[0].timestamp).total_seconds()
+        for key in attempt_keys(first):
+            stats.setdefault(key, {"attempts": 0, "successes": 0, "solved": 0})["solved"] += 1
+            for metric, value in (("attempts", tries), ("seconds", seconds)):
+                bucket = (*key, metric, bisect.bisect_left(BUCKETS[metric], value))
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+
+    return (
+        [{"scope": scope, "key": key, **s} for (scope, key), s in stats.items()],
+        [{"scope": scope, "key": key, "metric": metric, "bucket": b, "count": c}
+         for (scope, key, metric, b), c in buckets.items()],
+    )
+
+
+def update_batch(batch_size=config.COHORT_BATCH_SIZE):
+    """Folds the next batch of new attempts into the cohort tables. Returns how many it took."""
+    last_id = database.get_cohort_cursor()
+    rows = database.get_attempts_after(last_id, batch_size)
+    if not rows:
+        return 0
+
+    solved_now = {r.session_id for r in rows if r.is_success and r.session_id != "unknown"}
+    history = database.get_sessions_attempts(solved_now, rows[-1].id) if solved_now else []
+    stats, buckets = batch_deltas(last_id, rows, history)
+    if not database.save_cohort_batch(last_id, rows[-1].id, stats, buckets):
+        return 0  # Another process folded these in first
+    return len(rows)
+
+
+def bucket_median(metric, counts):
+    """Median read from bucket counts ({bucket index: count}) as the matching bucket's upper bound."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    seen = 0
+    for i in sorted(counts):
+        seen += counts[i]
+        if seen >= total / 2:
+            bounds = BUCKETS[metric]
+            return bounds[i] if i < len(bounds) else float("inf")
+
+
+class CohortStats:
+    """
+    Per-snippet and per-error-type difficulty across all students: success rate,
+    median attempts to solve and median time to solve.
+
+    New attempts are folded into the cohort tables in batches past a high-water
+    mark, so no refresh rescans the attempts table. Lookups read an in-memory
+    snapshot and never wait on the database: once it is older than
+    `refresh_interval`, a lookup starts a background refresh.
+    """
+
+    def __init__(self, refresh_interval=config.COHORT_REFRESH_INTERVAL, prior_attempts=config.COHORT_PRIOR_ATTEMPTS):
+        self.refresh_interval = refresh_interval
+        self.prior_attempts = prior_attempts
+        self._stats = {}  # (scope, key) -> stats dict
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Folds in every new attempt, then reloads the snapshot."""
+        try:
+            while update_batch():
+                pass
+            self._load()
+        except Exception as e:
+            print(f"⚠️ Cohort stats refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._loaded_at = time.monotonic()
+                self._refreshing = False
+
+    def maybe_refresh(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="cohort-refresh", daemon=True).start()
+
+    def _load(self):
+        rows, bucket_rows = database.get_cohort_stats()
+        counts = {}
+        for b in bucket_rows:
+            counts.setdefault((b["scope"], b["key"], b["metric"]), {})[b["bucket"]] = b["count"]
+
+        stats = {}
+        for r in rows:
+            key = (r["scope"], r["key"])
+            stats[key] = {
+                "attempts": r["attempts"],
+                "successes": r["successes"],
+                "solved": r["solved"],
+                "success_rate": r["successes"] / r["attempts"] if r["attempts"] else None,
+                "median_attempts": bucket_median("attempts", counts.get((*key, "attempts"), {})),
+                "median_seconds": bucket_median("seconds", counts.get((*key, "seconds"), {})),
+            }
+        self._stats = stats
+
+    def lookup(self, scope, key):
+        """Stats dict for a snippet id / error type, or None without data."""
+        self.maybe_refresh()
+        return self._stats.get((scope, key))
+
+    def success_rate(self, snippet):
+        """
+        Estimated chance an attempt at `snippet` passes: its own rate, pulled towards
+        its error type's rate while it has few attempts. None without any data.
+        """
+        own = self.lookup("snippet", snippet.get("id"))
+        group = self.lookup("error_type", snippet.get("error_type"))
+        prior = group["success_rate"] if group else None
+        if not own or not own["attempts"]:
+            return prior
+        if prior is None:
+            return own["success_rate"]
+        return (own["successes"] + self.prior_attempts * prior) / (own["attempts"] + self.prior_attempts)
+
+    def order(self, snippets):
+        """Snippets from easiest to hardest for the cohort; ones without data keep their place among equals."""
+        rates = [self.success_rate(s) for s in snippets]
+        known = [r for r in rates if r is not None]
+        if not known:
+            return list(snippets)
+        neutral = sum(known) / len(known)
+        ranked = sorted(zip(snippets, rates), key=lambda pair: -(neutral if pair[1] is None else pair[1]))
+        return [s for s, _ in ranked]
+
+
+if __name__ == "__main__":
+    # Catch up from the command line, e.g. after importing a large attempt history
+    started = time.perf_counter()
+    total = 0
+    while taken := update_batch():
+        total += taken
+    print(f"✅ Folded {total} attempts into the cohort stats in {time.perf_counter() - started:.1f}s "
+          f"(high-water mark: attempt {database.get_cohort_cursor()}).")
@@ -10,6 +10,11 @@ IDS_PATH = os.path.join(DATA_DIR, "snippet_ids.json")
 
 EMBEDDING_MODEL_NAME = "microsoft/codebert-base"
 
+# Set TUTOR_FAKE_GEMINI=1 (or replay) or =record to use the local fake_gemini backend.
+# Any other value, including 0 / false / unset, uses the real SDK.
+FAKE_GEMINI_MODE = os.environ.get("TUTOR_FAKE_GEMINI", "").strip().lower()
+FAKE_GEMINI = FAKE_GEMINI_MODE in ("1", "replay", "record")
+
 # Define a list of keys
 GEMINI_KEYS = [
     "enter your API key here",
@@ -17,6 +22,88 @@ GEMINI_KEYS = [
     ...
 ]
 
+# Seconds before a key's list_models() result is fetched again
+MODEL_CATALOG_TTL = 600
+
+# Background key probe at startup, shared between processes through a status file:
+# how long an online / offline result is reused, and how long to wait on another process's probe
+BRAIN_STATUS_PATH = os.path.join(DATA_DIR, "brain_status.json")
+BRAIN_STATUS_TTL = 600
+BRAIN_OFFLINE_TTL = 60
+BRAIN_PROBE_TIMEOUT = 60
+
+# Per-key rate limit (token bucket) and circuit breaker cool-down (seconds)
+KEY_RATE_PER_MINUTE = 15
+KEY_BURST = 5
+KEY_COOLDOWN_BASE = 5.0
+KEY_COOLDOWN_MAX = 300.0
+KEY_ACQUIRE_TIMEOUT = 5.0
+
+# Async LLM client: max concurrent Gemini calls, streamed tutor replies included
+# (also its worker threads), per-call deadline (seconds), longest sleep between
+# checks while waiting for a key, and hedging (second key after the p95 latency;
+# default delay until enough samples)
+LLM_MAX_CONCURRENCY = 8
+LLM_KEY_POLL_INTERVAL = 0.1
+LLM_DEADLINE = 30.0
+LLM_HEDGE = True
+LLM_HEDGE_DELAY = 3.0
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Background prefetch of opening warm-up questions
+PREFETCH_WORKERS = 4
+PREFETCH_MAX_ENTRIES = 256
+PREFETCH_WAIT = 3.0
+
+# Seconds the tutor may wait for Gemini's first words in each phase before
+# answering from local material, and how long a late answer may still replace it
+TUTOR_LATENCY_BUDGETS = {"Warmup": 3.0, "Fixing": 4.0}
+TUTOR_LATENCY_BUDGET_DEFAULT = 4.0
+TUTOR_LATE_ANSWER_GRACE = 8.0
+
+# Tutor chat history: approximate token budget for the verbatim turns,
+# how many recent turns to keep verbatim and how many to fold at a time
+CHAT_HISTORY_TOKEN_BUDGET = 1000
+CHAT_KEEP_LAST_TURNS = 6
+CHAT_FOLD_STEP = 4
+CHAT_SUMMARY_MAX_TOKENS = 200
+
+# Judge verdict cache: in-memory LRU size and entry lifetime (seconds)
+VERDICT_CACHE_SIZE = 2048
+VERDICT_CACHE_TTL = 7 * 24 * 3600
+
+# LLM call metrics: JSON file with the aggregated histograms, rewritten at most every N seconds
+METRICS_PATH = os.path.join(DATA_DIR, "llm_metrics.json")
+METRICS_FLUSH_INTERVAL = 30
+
+# Dashboard: sessions loaded per "Load older sessions" page
+SESSION_PAGE_SIZE = 10
+# Rendered plotly figures kept per chart (keyed on the skill vector / latest attempt)
+CHART_CACHE_ENTRIES = 256
+
+# Cohort statistics (cohort.py): attempts folded in per batch, seconds between refreshes,
+# and how many attempts of the error type's success rate a snippet's own rate starts from
+COHORT_BATCH_SIZE = 5000
+COHORT_REFRESH_INTERVAL = 120
+COHORT_PRIOR_ATTEMPTS = 5
+
+# Knowledge tracing (knowledge.py): parameters used before the first fit, EM limits
+# (iterations, tolerance, attempts per student and skill it fits on), and the mastery
+# probability at which a skill counts as mastered
+KT_DEFAULT_PARAMS = {"p_init": 0.2, "p_learn": 0.15, "p_guess": 0.2, "p_slip": 0.1}
+KT_EM_ITERATIONS = 50
+KT_EM_TOLERANCE = 1e-6
+KT_EM_MAX_STEPS = 500
+KT_MASTERY_THRESHOLD = 0.95
+
+# Usernames that see the admin tools in the sidebar
+ADMIN_USERS = []
+
 CONFIDENCE_THRESHOLD = 0.60
 SYNTAX_THRESHOLD = 0.40
 
+# Sandboxed test execution (used by the judge for snippets that define "tests")
+SANDBOX_POOL_SIZE = 2
+SANDBOX_TIMEOUT = 2.0
+SANDBOX_CPU_SECONDS = 1
+SANDBOX_MEMORY_MB = 256
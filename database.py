@@ -1,13 +1,42 @@
+import atexit
+import contextlib
+import contextvars
 import datetime
 import hashlib
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-import json
+import os
+import threading
+from collections import Counter
+from sqlalchemy import create_engine, event, case, func, insert, select, text, update, tuple_, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased, declarative_base, sessionmaker, relationship
 
 DB_NAME = "tutor.db"
-engine = create_engine(f"sqlite:///{DB_NAME}", echo=False)
+engine = None  # Created (with the tables) on first use, see get_engine()
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
+_session_factory = sessionmaker()
+_engine_lock = threading.Lock()
+_current_session = contextvars.ContextVar("current_session", default=None)
+_request_cache = contextvars.ContextVar("request_cache", default=None)
+
+# Applied to every new connection. WAL lets dashboard readers run while a student's
+# attempt is being written; NORMAL sync is safe in WAL mode and skips an fsync per commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,  # ms to wait for a lock before "database is locked"
+    "cache_size": -20000,  # KiB (20 MB) of page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+SQLITE_POOL_SIZE = 10
+SQLITE_MAX_OVERFLOW = 20
+
+# Optional write-behind for log_attempt (TUTOR_WRITE_BEHIND=1): attempts are buffered
+# and inserted in batches every WRITE_BEHIND_INTERVAL seconds or WRITE_BEHIND_MAX_BATCH rows
+WRITE_BEHIND = os.environ.get("TUTOR_WRITE_BEHIND") == "1"
+WRITE_BEHIND_INTERVAL = 0.2
+WRITE_BEHIND_MAX_BATCH = 200
+WRITE_BEHIND_MAX_PENDING = 1000
 
 
 class User(Base):
@@ -26,7 +55,7 @@ class User(Base):
 class UserSkill(Base):
     __tablename__ = 'user_skills'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
 
     loops = Column(Float, default=0.0)
     recursion = Column(Float, default=0.0)
@@ -37,104 +66,593 @@ class UserSkill(Base):
     user = relationship("User", back_populates="skill_profile")
 
 
+# Skill names used across the app -> UserSkill columns
+SKILL_COLUMNS = {
+    "Loops": "loops",
+    "Recursion": "recursion",
+    "Syntax": "syntax",
+    "Logic": "logic",
+    "Data_Structures": "data_structures",
+}
+# Skill name -> Attempt column with the points that attempt earned
+REWARD_COLUMNS = {skill: f"reward_{col}" for skill, col in SKILL_COLUMNS.items()}
+
+
 class Attempt(Base):
     __tablename__ = 'attempts'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     session_id = Column(String)
     snippet_id = Column(String)
+    error_type = Column(String)  # Of the snippet the attempt was matched to (None before migration 4)
     user_code = Column(String)
     is_success = Column(Boolean)
-    rewards_json = Column(String, default="{}")
+    rewards_json = Column(String, default="{}")  # Legacy: rows before migration 3; see the reward_* columns
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
+    reward_loops = Column(Float, default=0.0)
+    reward_recursion = Column(Float, default=0.0)
+    reward_syntax = Column(Float, default=0.0)
+    reward_logic = Column(Float, default=0.0)
+    reward_data_structures = Column(Float, default=0.0)
+
     user = relationship("User", back_populates="attempts")
 
+    # Every attempts query filters on user / session (and success) and orders by time
+    __table_args__ = (
+        Index("ix_attempts_user_time", "user_id", "timestamp"),
+        Index("ix_attempts_session_time", "session_id", "timestamp"),
+        Index("ix_attempts_user_success_time", "user_id", "is_success", "timestamp"),
+    )
 
-def init_db():
-    """Creates the tables if they don't exist."""
-    Base.metadata.create_all(engine)
-    print(f"✅ Database '{DB_NAME}' initialized.")
 
+class SkillProgress(Base):
+    """Skill points gained per session, kept up to date as rewarded attempts are logged (see add_progress)."""
+    __tablename__ = 'skill_progress'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    session_id = Column(String, nullable=False)
+    started_at = Column(DateTime)  # First reward of the session, which orders the chart
+    loops = Column(Float, default=0.0)
+    recursion = Column(Float, default=0.0)
+    syntax = Column(Float, default=0.0)
+    logic = Column(Float, default=0.0)
+    data_structures = Column(Float, default=0.0)
 
-def hash_pass(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    __table_args__ = (
+        Index("ux_skill_progress_user_session", "user_id", "session_id", unique=True),
+        Index("ix_skill_progress_user_time", "user_id", "started_at"),
+    )
 
 
-def register_user(username, password, display_name):
+class CohortStat(Base):
+    """Attempt statistics across all users for one snippet or error type (maintained by cohort.py)."""
+    __tablename__ = 'cohort_stats'
+    id = Column(Integer, primary_key=True)
+    scope = Column(String, nullable=False)  # "snippet" | "error_type"
+    key = Column(String, nullable=False)
+    attempts = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    solved = Column(Integer, default=0)  # Sessions that reached their first success
+
+    __table_args__ = (Index("ux_cohort_stats_scope_key", "scope", "key", unique=True),)
+
+
+class CohortBucket(Base):
+    """Histogram counts (attempts / seconds to solve) behind the cohort medians."""
+    __tablename__ = 'cohort_buckets'
+    id = Column(Integer, primary_key=True)
+    scope = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    metric = Column(String, nullable=False)  # "attempts" | "seconds"
+    bucket = Column(Integer, nullable=False)  # Index into the metric's bucket bounds
+    count = Column(Integer, default=0)
+
+    __table_args__ = (Index("ux_cohort_buckets", "scope", "key", "metric", "bucket", unique=True),)
+
+
+class CohortCursor(Base):
+    """High-water mark (last attempt id folded in) of the cohort batch job."""
+    __tablename__ = 'cohort_cursor'
+    name = Column(String, primary_key=True)
+    last_attempt_id = Column(Integer, default=0)
+
+
+class KnowledgeParam(Base):
+    """Knowledge-tracing parameters of one skill, fitted offline by knowledge.py."""
+    __tablename__ = 'knowledge_params'
+    skill = Column(String, primary_key=True)
+    p_init = Column(Float, nullable=False)
+    p_learn = Column(Float, nullable=False)
+    p_guess = Column(Float, nullable=False)
+    p_slip = Column(Float, nullable=False)
+    observations = Column(Integer, default=0)  # Attempts the fit saw
+    fitted_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class KnowledgeState(Base):
+    """Probability that a user has mastered a skill, updated after each of their attempts."""
+    __tablename__ = 'knowledge_states'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    skill = Column(String, nullable=False)
+    p_known = Column(Float, nullable=False)
+    observations = Column(Integer, default=0)
+
+    __table_args__ = (Index("ux_knowledge_states_user_skill", "user_id", "skill", unique=True),)
+
+
+class JudgeVerdict(Base):
+    __tablename__ = 'judge_verdicts'
+    key = Column(String, primary_key=True)  # Hash of canonical (original, fix, target error)
+    passed = Column(Boolean, nullable=False)
+    message = Column(String)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+def add_missing_columns(table, columns):
+    """Migration step: ALTER TABLE ... ADD COLUMN for each (name, type) the table doesn't have yet."""
+    def step(conn):
+        existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+        for name, ddl in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    return step
+
+
+# Versioned changes for existing databases (create_all never alters a table that exists).
+# Also put new columns / indexes on the models so fresh databases get them from create_all,
+# and keep every step idempotent (IF NOT EXISTS, add_missing_columns) for that reason.
+# A step is an SQL string or a callable that gets the connection.
+MIGRATIONS = [
+    (1, "Composite indexes on attempts and user_skills.user_id", [
+        "CREATE INDEX IF NOT EXISTS ix_attempts_user_time ON attempts (user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_attempts_session_time ON attempts (session_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_attempts_user_success_time ON attempts (user_id, is_success, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_user_skills_user_id ON user_skills (user_id)",
+    ]),
+    # (skill_progress itself comes from create_all)
+    (2, "Backfill skill_progress from rewarded attempts", [
+        "INSERT OR IGNORE INTO skill_progress "
+        "(user_id, session_id, started_at, loops, recursion, syntax, logic, data_structures) "
+        "SELECT user_id, session_id, MIN(timestamp), "
+        + ", ".join(f"SUM(COALESCE(json_extract(rewards_json, '$.{skill}'), 0))" for skill in SKILL_COLUMNS)
+        + " FROM attempts WHERE is_success = 1 AND rewards_json IS NOT NULL AND rewards_json NOT IN ('', '{}') "
+        "GROUP BY user_id, session_id",
+    ]),
+    (3, "Reward columns on attempts, copied from rewards_json", [
+        add_missing_columns("attempts", [(col, "FLOAT DEFAULT 0") for col in REWARD_COLUMNS.values()]),
+        "UPDATE attempts SET "
+        + ", ".join(f"{col} = COALESCE(json_extract(rewards_json, '$.{skill}'), 0)" for skill, col in REWARD_COLUMNS.items())
+        + " WHERE rewards_json IS NOT NULL AND rewards_json NOT IN ('', '{}')",
+    ]),
+    (4, "Error type on attempts", [
+        add_missing_columns("attempts", [("error_type", "VARCHAR")]),
+    ]),
+]
+
+
+def run_migrations(db_engine):
+    """
+    Applies the MIGRATIONS the database hasn't seen yet, each in its own transaction.
+    Each one takes the write lock up front and re-checks schema_migrations, so workers
+    starting together apply it once; the others wait (busy timeout) and skip it.
+    """
+    with db_engine.connect() as conn:
+        applied = {v for (v,) in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    for version, name, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        with db_engine.begin() as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            if conn.execute(text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": version}).first():
+                continue  # Another process applied it first
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, name=name, applied_at=datetime.datetime.utcnow()))
+        print(f"✅ Migration {version} applied: {name}")
+
+
+def get_engine():
+    """Creates the engine and the tables the first time the database is used."""
+    global engine
+    if engine is None:
+        with _engine_lock:
+            if engine is None:
+                new_engine = create_engine(
+                    f"sqlite:///{DB_NAME}", echo=False,
+                    connect_args={"check_same_thread": False},
+                    pool_size=SQLITE_POOL_SIZE, max_overflow=SQLITE_MAX_OVERFLOW,
+                )
+                event.listen(new_engine, "connect", apply_pragmas)
+                Base.metadata.create_all(new_engine)
+                run_migrations(new_engine)
+                _session_factory.configure(bind=new_engine)
+                engine = new_engine
+                print(f"✅ Database '{DB_NAME}' initialized.")
+    return engine
+
+
+def apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def Session():
+    """Opens a session, initializing the database on first use."""
+    get_engine()
+    return _session_factory()
+
+
+@contextlib.contextmanager
+def unit_of_work(user_id=None, session_id=None):
+    """
+    One session and transaction for a block of helper calls: every helper called
+    inside reuses it instead of opening its own, reads share one snapshot, and
+    writes are committed together at the end (or rolled back on an error).
+    Pass the user (or session) a block reads or logs attempts for, so its buffered
+    attempts are in the snapshot and written before the block's own (keeping id order).
+    Keep the block short: it holds a pooled connection until it exits.
+    """
+    if _current_session.get() is not None:
+        yield _current_session.get()
+        return
+
+    # The snapshot starts with the first query: flush only this reader's buffered attempts,
+    # other users' rows are left to the background writer
+    if user_id is not None or session_id is not None:
+        read_your_writes(user_id, session_id)
+
     session = Session()
-    if session.query(User).filter_by(username=username).first():
+    token = _current_session.set(session)
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        _current_session.reset(token)
         session.close()
-        return False, "Username already exists."
 
-    new_user = User(
-        username=username,
-        password_hash=hash_pass(password),
-        display_name=display_name
-    )
-    session.add(new_user)
-    session.commit()
 
-    new_skills = UserSkill(user_id=new_user.id)
-    session.add(new_skills)
-    session.commit()
+@contextlib.contextmanager
+def session_scope():
+    """Session for one helper: the active unit of work's, or its own one committed on exit."""
+    session = _current_session.get()
+    if session is not None:
+        yield session  # The unit of work commits
+        return
+
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+@contextlib.contextmanager
+def request_cache():
+    """
+    Caches per-user facts (skills, stats) for one block, e.g. a Streamlit rerun,
+    so each is read from the database at most once. The write helpers invalidate
+    what they change; anything written by other processes shows up next block.
+    """
+    if _request_cache.get() is not None:
+        yield
+        return
+
+    token = _request_cache.set({})
+    try:
+        yield
+    finally:
+        _request_cache.reset(token)
+
+
+def cached_for_request(kind, user_id, load):
+    cache = _request_cache.get()
+    if cache is None:
+        return load()
+    if (kind, user_id) not in cache:
+        cache[(kind, user_id)] = load()
+    value = cache[(kind, user_id)]
+    return dict(value) if value is not None else None  # Callers may modify their copy
+
+
+def invalidate_user(user_id, *kinds):
+    """Drops the request-cached facts (all, or only `kinds`) of a user after a write."""
+    cache = _request_cache.get()
+    if cache:
+        for key in [k for k in cache if k[1] == user_id and (not kinds or k[0] in kinds)]:
+            del cache[key]
+
+
+class AttemptBuffer:
+    """
+    Write-behind queue for log_attempt. A background thread inserts the buffered
+    rows in one transaction every `interval` seconds, or sooner once `max_batch`
+    rows are waiting, and again at shutdown. If writers outpace it and `max_pending`
+    rows pile up, the writer flushes synchronously instead (backpressure).
+
+    Read-your-writes: readers call flush_for() first, which writes only the rows of
+    the user or session they are about to read. It waits for a batch in flight only
+    if that batch holds some of their rows, so each user's attempts commit in order.
+    """
+
+    def __init__(self, interval=WRITE_BEHIND_INTERVAL, max_batch=WRITE_BEHIND_MAX_BATCH,
+                 max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._rows = []
+        self._pending_users = Counter()  # Rows not yet committed, by user / session
+        self._pending_sessions = Counter()
+        self._writing_users = Counter()  # The part of those being written right now
+        self._writing_sessions = Counter()
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)  # Notified when a write ends
+        self._flush_lock = threading.Lock()  # One bulk flush at a time
+        self._wake = threading.Event()
+        self._closed = False
+        threading.Thread(target=self._run, name="attempt-writer", daemon=True).start()
+        atexit.register(self.close)
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            self._pending_users[row["user_id"]] += 1
+            self._pending_sessions[row["session_id"]] += 1
+            waiting = len(self._rows)
+        if waiting >= self.max_pending:
+            self.flush()
+        elif waiting >= self.max_batch:
+            self._wake.set()
+
+    def has_pending(self, user_id=None, session_id=None):
+        with self._lock:
+            if user_id is None and session_id is None:
+                return bool(self._pending_users)
+            return self._pending_users[user_id] > 0 or self._pending_sessions[session_id] > 0
+
+    def flush_for(self, user_id=None, session_id=None):
+        """Writes the buffered rows of this user / session now; everyone else's wait for the writer thread."""
+        def mine(row):
+            return row["user_id"] == user_id or row["session_id"] == session_id
+
+        with self._written:
+            if not (self._pending_users[user_id] or self._pending_sessions[session_id]):
+                return 0
+            self._written.wait_for(lambda: not (self._writing_users[user_id] or self._writing_sessions[session_id]))
+            rows = [r for r in self._rows if mine(r)]
+            self._rows = [r for r in self._rows if not mine(r)]
+            self._mark_writing(rows, 1)
+        return self._write(rows)
+
+    def flush(self):
+        """
+        Inserts everything buffered so far, `max_batch` rows per transaction, so a
+        reader waiting on its rows in flight never waits long. Returns the number written.
+        """
+        written = 0
+        with self._flush_lock:
+            with self._lock:
+                left = len(self._rows)  # Rows added meanwhile wait for the next flush
+            while left > 0:
+                with self._lock:
+                    rows, self._rows = self._rows[:min(left, self.max_batch)], self._rows[min(left, self.max_batch):]
+                    self._mark_writing(rows, 1)
+                if not rows:
+                    break
+                left -= len(rows)
+                written += self._write(rows)
+        return written
+
+    def _mark_writing(self, rows, sign):
+        for r in rows:
+            self._writing_users[r["user_id"]] += sign
+            self._writing_sessions[r["session_id"]] += sign
+        self._writing_users += Counter()  # Drop zero counts
+        self._writing_sessions += Counter()
+
+    def _write(self, rows):
+        if not rows:
+            return 0
+
+        # Own session: must not join (or be rolled back with) a caller's unit of work
+        session = Session()
+        try:
+            session.execute(insert(Attempt), rows)
+            add_progress(session, rows)
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self._written:
+                self._rows[:0] = rows  # Keep them for the next try, in order
+                self._mark_writing(rows, -1)
+                self._written.notify_all()
+            raise
+        finally:
+            session.close()
+
+        # Only now are they readable, so readers that saw them pending have waited on this write
+        with self._written:
+            self._mark_writing(rows, -1)
+            self._pending_users.subtract(r["user_id"] for r in rows)
+            self._pending_sessions.subtract(r["session_id"] for r in rows)
+            self._pending_users += Counter()
+            self._pending_sessions += Counter()
+            self._written.notify_all()
+        return len(rows)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Attempt write-behind flush failed, will retry: {e}")
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+
+_attempt_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_attempt_buffer():
+    """The write-behind buffer, or None when WRITE_BEHIND is off."""
+    global _attempt_buffer
+    if WRITE_BEHIND and _attempt_buffer is None:
+        with _buffer_lock:
+            if _attempt_buffer is None:
+                _attempt_buffer = AttemptBuffer()
+    return _attempt_buffer
+
+
+def read_your_writes(user_id=None, session_id=None):
+    """
+    Flushes buffered attempts of this user / session before they are read.
+    A no-op inside a unit of work: its snapshot is fixed, so unit_of_work(user_id) flushes up front.
+    """
+    if _attempt_buffer is not None and _current_session.get() is None:
+        _attempt_buffer.flush_for(user_id, session_id)
+
+
+def init_db():
+    """Creates the tables if they don't exist."""
+    Base.metadata.create_all(get_engine())
+
+
+def hash_pass(password):
+    return hashlib.sha256(password.encode()).hexdigest()
 
-    session.close()
+
+def register_user(username, password, display_name):
+    with session_scope() as session:
+        if session.query(User).filter_by(username=username).first():
+            return False, "Username already exists."
+
+        new_user = User(
+            username=username,
+            password_hash=hash_pass(password),
+            display_name=display_name
+        )
+        session.add(new_user)
+        session.flush()
+
+        new_skills = UserSkill(user_id=new_user.id)
+        session.add(new_skills)
     return True, "Registration successful!"
 
 
 def login_user(username, password):
-    session = Session()
-    user = session.query(User).filter_by(
-        username=username,
-        password_hash=hash_pass(password)
-    ).first()
-
-    if user:
-        user_data = {
-            "id": user.id,
-            "username": user.username,
-            "display_name": user.display_name
-        }
-        session.close()
-        return user_data
-    session.close()
+    with session_scope() as session:
+        user = session.query(User).filter_by(
+            username=username,
+            password_hash=hash_pass(password)
+        ).first()
+
+        if user:
+            return {
+                "id": user.id,
+                "username": user.username,
+                "display_name": user.display_name
+            }
     return None
 
 
-def log_attempt(user_id, snippet_id, code, success, session_id=None, rewards=None):
-    session = Session()
-    attempt = Attempt(
-        user_id=user_id,
-        snippet_id=snippet_id,
-        user_code=code,
-        is_success=success,
-        session_id=session_id or "unknown",
-        rewards_json=json.dumps(rewards) if rewards else "{}"
-    )
-    session.add(attempt)
-    session.commit()
-    session.close()
+def log_attempt(user_id, snippet_id, code, success, session_id=None, rewards=None, error_type=None):
+    """
+    Records an attempt. With WRITE_BEHIND it is buffered and written in the next batch,
+    except inside a unit of work, where it must commit together with the rest. Step 3
+    logs fix submissions in one (with their skill points), so only the step 1 analysis
+    log is ever deferred.
+    """
+    row = {
+        "user_id": user_id,
+        "snippet_id": snippet_id,
+        "error_type": error_type,
+        "user_code": code,
+        "is_success": success,
+        "session_id": session_id or "unknown",
+        "timestamp": datetime.datetime.utcnow(),
+        **{col: float((rewards or {}).get(skill, 0)) for skill, col in REWARD_COLUMNS.items()},
+    }
+    invalidate_user(user_id, "stats")
+    buffer = get_attempt_buffer()
+    if buffer is not None and _current_session.get() is None:
+        buffer.add(row)
+        return
+
+    with session_scope() as session:
+        session.add(Attempt(**row))
+        add_progress(session, [row])
+
+
+def rewards_of(row):
+    """{skill: points} for the non-zero reward_* columns of an attempt (or an aggregate row)."""
+    return {skill: getattr(row, col) for skill, col in REWARD_COLUMNS.items() if getattr(row, col)}
+
+
+def add_progress(session, rows):
+    """Adds the rewards of logged attempt rows to their sessions' skill_progress rows."""
+    params = []
+    for row in rows:
+        if row["is_success"] and any(row[col] for col in REWARD_COLUMNS.values()):
+            params.append({"user_id": row["user_id"], "session_id": row["session_id"], "started_at": row["timestamp"],
+                           **{col: row[REWARD_COLUMNS[skill]] for skill, col in SKILL_COLUMNS.items()}})
+    if not params:
+        return
+
+    stmt = sqlite_insert(SkillProgress)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "session_id"],
+        set_={col: getattr(SkillProgress, col) + getattr(stmt.excluded, col) for col in SKILL_COLUMNS.values()},
+    ), params)
 
 
 def get_user_skills(user_id):
-    """Returns the user's skill vector as a dictionary."""
-    session = Session()
-    skills = session.query(UserSkill).filter_by(user_id=user_id).first()
+    """Returns the user's skill vector as a dictionary (cached for the current request)."""
+    return cached_for_request("skills", user_id, lambda: load_user_skills(user_id))
 
-    if not skills:
-        session.close()
-        return None
 
-    vector = {
-        "Loops": skills.loops,
-        "Recursion": skills.recursion,
-        "Syntax": skills.syntax,
-        "Logic": skills.logic,
-        "Data_Structures": skills.data_structures
-    }
-    session.close()
-    return vector
+def load_user_skills(user_id):
+    with session_scope() as session:
+        skills = session.query(UserSkill).filter_by(user_id=user_id).first()
+
+        if not skills:
+            return None
+
+        return {
+            "Loops": skills.loops,
+            "Recursion": skills.recursion,
+            "Syntax": skills.syntax,
+            "Logic": skills.logic,
+            "Data_Structures": skills.data_structures
+        }
 
 
 def update_user_skills(user_id, skill_updates):
@@ -142,118 +660,360 @@ def update_user_skills(user_id, skill_updates):
     Updates specific skills for a user.
     skill_updates: dict, e.g., {"Syntax": 2.0, "Loops": 1.0}
     """
-    session = Session()
-    skills = session.query(UserSkill).filter_by(user_id=user_id).first()
+    invalidate_user(user_id, "skills")
+    with session_scope() as session:
+        skills = session.query(UserSkill).filter_by(user_id=user_id).first()
 
-    if skills:
-        if "Loops" in skill_updates: skills.loops = skill_updates["Loops"]
-        if "Recursion" in skill_updates: skills.recursion = skill_updates["Recursion"]
-        if "Syntax" in skill_updates: skills.syntax = skill_updates["Syntax"]
-        if "Logic" in skill_updates: skills.logic = skill_updates["Logic"]
-        if "Data_Structures" in skill_updates: skills.data_structures = skill_updates["Data_Structures"]
+        if skills:
+            if "Loops" in skill_updates: skills.loops = skill_updates["Loops"]
+            if "Recursion" in skill_updates: skills.recursion = skill_updates["Recursion"]
+            if "Syntax" in skill_updates: skills.syntax = skill_updates["Syntax"]
+            if "Logic" in skill_updates: skills.logic = skill_updates["Logic"]
+            if "Data_Structures" in skill_updates: skills.data_structures = skill_updates["Data_Structures"]
 
-        session.commit()
-    session.close()
+
+def increment_user_skills(user_id, deltas):
+    """
+    Adds deltas (e.g. {"Loops": 1.0}) to the user's skills with a single
+    UPDATE ... SET loops = loops + ?, so parallel tabs can't overwrite each
+    other's points. Inside a unit of work it commits together with the rest
+    (e.g. the log_attempt that earned the points).
+    Returns the new skill vector, or None if the user has no skill profile.
+    """
+    invalidate_user(user_id, "skills")
+    columns = [getattr(UserSkill, c) for c in SKILL_COLUMNS.values()]
+    values = {getattr(UserSkill, SKILL_COLUMNS[name]): getattr(UserSkill, SKILL_COLUMNS[name]) + float(delta)
+              for name, delta in deltas.items() if name in SKILL_COLUMNS and delta}
+
+    with session_scope() as session:
+        if values:
+            row = session.execute(
+                update(UserSkill).where(UserSkill.user_id == user_id).values(values).returning(*columns),
+                execution_options={"synchronize_session": "fetch"}
+            ).first()
+        else:
+            row = session.query(*columns).filter(UserSkill.user_id == user_id).first()
+
+    if row is None:
+        return None
+    return {name: float(value or 0.0) for name, value in zip(SKILL_COLUMNS, row)}
 
 
 def get_user_stats(user_id):
-    """Returns total attempts and success count."""
-    session = Session()
-    total = session.query(Attempt).filter_by(user_id=user_id).count()
-    success = session.query(Attempt).filter_by(user_id=user_id, is_success=True).count()
-    session.close()
+    """Returns total attempts and success count (cached for the current request)."""
+    return cached_for_request("stats", user_id, lambda: load_user_stats(user_id))
+
+
+def load_user_stats(user_id):
+    read_your_writes(user_id)
+    with session_scope() as session:
+        total, success = session.query(
+            func.count(Attempt.id),
+            func.coalesce(func.sum(case((Attempt.is_success.is_(True), 1), else_=0)), 0)
+        ).filter(Attempt.user_id == user_id).one()
     return {"total": total, "success": success}
 
 
 def get_user_history(user_id, limit=10):
     """Returns the last N attempts for the dashboard history."""
-    session = Session()
-    attempts = session.query(Attempt).filter_by(user_id=user_id).order_by(Attempt.timestamp.desc()).limit(limit).all()
-
-    history = []
-    for a in attempts:
-        history.append({
-            "id": a.snippet_id,
-            "code": a.user_code,
-            "status": "✅ Solved" if a.is_success else "❌ Failed",
-            "time": a.timestamp.strftime("%Y-%m-%d %H:%M")
-        })
-    session.close()
+    read_your_writes(user_id)
+    with session_scope() as session:
+        attempts = session.query(Attempt).filter_by(user_id=user_id).order_by(
+            Attempt.timestamp.desc()).limit(limit).all()
+
+        history = []
+        for a in attempts:
+            history.append({
+                "id": a.snippet_id,
+                "code": a.user_code,
+                "status": "✅ Solved" if a.is_success else "❌ Failed",
+                "time": a.timestamp.strftime("%Y-%m-%d %H:%M")
+            })
     return history
 
 
+def get_last_attempt_id(user_id):
+    """Id of the user's newest attempt (None without any), e.g. to key caches that must refresh after one."""
+    read_your_writes(user_id)
+    with session_scope() as session:
+        row = session.query(Attempt.id).filter(Attempt.user_id == user_id).order_by(
+            Attempt.timestamp.desc(), Attempt.id.desc()).first()
+    return row.id if row else None
+
+
 def get_last_unfinished(user_id):
     """Finds the most recent failed attempt to allow 'Resuming'."""
-    session = Session()
-    last = session.query(Attempt).filter_by(user_id=user_id).order_by(Attempt.timestamp.desc()).first()
-    session.close()
+    read_your_writes(user_id)
+    with session_scope() as session:
+        last = session.query(Attempt).filter_by(user_id=user_id).order_by(Attempt.timestamp.desc()).first()
 
-    if last and not last.is_success:
-        return {"code": last.user_code, "id": last.snippet_id}
+        if last and not last.is_success:
+            return {"code": last.user_code, "id": last.snippet_id}
     return None
 
 
-def get_user_sessions(user_id):
-    """Returns a list of unique sessions with their status."""
-    session = Session()
-    unique_ids = session.query(Attempt.session_id).filter_by(user_id=user_id).distinct().all()
+def get_user_sessions_page(user_id, before=None, limit=10):
+    """
+    Returns (sessions, next_cursor): up to `limit` of the user's sessions that started
+    before the `before` cursor, newest first, with their status and summed rewards ("gains").
+    Pass `next_cursor` back to get the next page; it is None after the oldest session.
+    Each page costs the same two indexed queries, however long the history is.
+    """
+    read_your_writes(user_id)
+    earlier = aliased(Attempt)
+    with session_scope() as session:
+        # A session starts with its first attempt (no lower id in the same session)
+        query = session.query(Attempt.id, Attempt.session_id, Attempt.timestamp, Attempt.user_code).filter(
+            Attempt.user_id == user_id,
+            Attempt.session_id != "unknown",
+            ~session.query(earlier.id).filter(earlier.session_id == Attempt.session_id, earlier.id < Attempt.id).exists(),
+        )
+        if before is not None:
+            query = query.filter(tuple_(Attempt.timestamp, Attempt.id) < tuple(before))
+        firsts = query.order_by(Attempt.timestamp.desc(), Attempt.id.desc()).limit(limit + 1).all()
+
+        more = len(firsts) > limit
+        firsts = firsts[:limit]
+        session_ids = [r.session_id for r in firsts]
+        if not session_ids:
+            return [], None
+
+        # Session ids are unique uuids, so the session index alone bounds this to the page
+        summary = {r.session_id: r for r in session.query(
+            Attempt.session_id,
+            func.count(Attempt.id).label("attempts_count"),
+            func.max(Attempt.is_success).label("solved"),
+            *[func.sum(getattr(Attempt, col)).label(col) for col in REWARD_COLUMNS.values()],
+        ).filter(Attempt.session_id.in_(session_ids)).group_by(Attempt.session_id)}
+
+    sessions = [{
+        "session_id": r.session_id,
+        "timestamp": r.timestamp,
+        "initial_code": r.user_code,
+        "status": "✅ Solved" if summary[r.session_id].solved else "❌ Unsolved",
+        "attempts_count": summary[r.session_id].attempts_count,
+        "gains": rewards_of(summary[r.session_id])
+    } for r in firsts]
+
+    next_cursor = (firsts[-1].timestamp, firsts[-1].id) if more else None
+    return sessions, next_cursor
 
-    sessions = []
-    for (sid,) in unique_ids:
-        if sid == "unknown": continue
-        attempts = session.query(Attempt).filter_by(session_id=sid).order_by(Attempt.timestamp.asc()).all()
-        if not attempts: continue
 
-        first_attempt = attempts[0]
-        is_solved = any(a.is_success for a in attempts)
+def get_session_history(session_id):
+    """Returns all attempts for a specific session."""
+    read_your_writes(session_id=session_id)
+    with session_scope() as session:
+        attempts = session.query(Attempt).filter_by(session_id=session_id).order_by(Attempt.timestamp.asc()).all()
+        history = []
+        for a in attempts:
+            history.append({
+                "code": a.user_code,
+                "success": a.is_success,
+                "time": a.timestamp.strftime("%H:%M:%S"),
+                "rewards": rewards_of(a)
+            })
+    return history
 
-        sessions.append({
-            "session_id": sid,
-            "timestamp": first_attempt.timestamp,
-            "initial_code": first_attempt.user_code,
-            "status": "✅ Solved" if is_solved else "❌ Unsolved",
-            "attempts_count": len(attempts)
-        })
 
-    session.close()
-    sessions.sort(key=lambda x: x["timestamp"], reverse=True)
-    return sessions
+def get_progress_snapshots(user_id):
+    """Returns the skill points gained in each rewarded session, in the order the sessions started."""
+    read_your_writes(user_id)
+    with session_scope() as session:
+        rows = session.query(SkillProgress).filter_by(user_id=user_id).order_by(
+            SkillProgress.started_at.asc(), SkillProgress.id.asc()).all()
+        return [{
+            "session_id": r.session_id,
+            "started_at": r.started_at,
+            **{skill: getattr(r, col) or 0.0 for skill, col in SKILL_COLUMNS.items()},
+        } for r in rows]
 
 
-def get_session_history(session_id):
-    """Returns all attempts for a specific session."""
-    session = Session()
-    attempts = session.query(Attempt).filter_by(session_id=session_id).order_by(Attempt.timestamp.asc()).all()
-    history = []
-    for a in attempts:
-        rewards = json.loads(a.rewards_json) if a.rewards_json else {}
-        history.append({
-            "code": a.user_code,
-            "success": a.is_success,
-            "time": a.timestamp.strftime("%H:%M:%S"),
-            "rewards": rewards
-        })
-    session.close()
-    return history
+def replace_progress_snapshots(user_id, snapshots):
+    """Replaces the user's skill_progress rows (dicts like get_progress_snapshots returns)."""
+    with session_scope() as session:
+        session.query(SkillProgress).filter_by(user_id=user_id).delete()
+        session.add_all(SkillProgress(
+            user_id=user_id, session_id=s["session_id"], started_at=s["started_at"],
+            **{col: float(s.get(skill, 0)) for skill, col in SKILL_COLUMNS.items()},
+        ) for s in snapshots)
 
 
 def get_user_progress_data(user_id):
-    """Returns list of all score updates over time."""
-    session = Session()
-    # Get all successful attempts chronologically
-    attempts = session.query(Attempt).filter_by(user_id=user_id, is_success=True).order_by(
-        Attempt.timestamp.asc()).all()
-
-    data = []
-    for a in attempts:
-        data.append({
-            "timestamp": a.timestamp,
-            "session_id": a.session_id,
-            "rewards": json.loads(a.rewards_json) if a.rewards_json else {}
-        })
-    session.close()
+    """Returns list of all score updates over time (the raw history behind skill_progress)."""
+    read_your_writes(user_id)
+    with session_scope() as session:
+        # Get all successful attempts chronologically
+        attempts = session.query(Attempt).filter_by(user_id=user_id, is_success=True).order_by(
+            Attempt.timestamp.asc()).all()
+
+        data = []
+        for a in attempts:
+            data.append({
+                "timestamp": a.timestamp,
+                "session_id": a.session_id,
+                "rewards": rewards_of(a)
+            })
     return data
 
 
-# Initialize tables immediately when imported
-init_db()
\ No newline at end of file
+def get_reward_totals(user_id=None):
+    """Skill points earned through attempts, summed in SQL: one user's, or the whole cohort's (user_id=None)."""
+    read_your_writes(user_id)
+    with session_scope() as session:
+        query = session.query(
+            *[func.coalesce(func.sum(getattr(Attempt, col)), 0.0).label(col) for col in REWARD_COLUMNS.values()]
+        ).filter(Attempt.is_success.is_(True))
+        if user_id is not None:
+            query = query.filter(Attempt.user_id == user_id)
+        return {skill: float(value) for skill, value in rewards_of(query.one()).items()}
+
+
+def get_cached_verdict(key, max_age_seconds):
+    """
+    Returns (passed, message, stored_at) for a cached judge verdict younger than max_age_seconds, else None.
+    stored_at is a Unix timestamp.
+    """
+    with session_scope() as session:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age_seconds)
+        row = session.query(JudgeVerdict).filter(JudgeVerdict.key == key, JudgeVerdict.created_at >= cutoff).first()
+
+        if row:
+            row.hits = (row.hits or 0) + 1
+            return row.passed, row.message, row.created_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+    return None
+
+
+def save_cached_verdict(key, passed, message):
+    with session_scope() as session:
+        session.merge(JudgeVerdict(key=key, passed=passed, message=message, hits=0,
+                                   created_at=datetime.datetime.utcnow()))
+
+
+def purge_cached_verdicts(older_than_seconds=None):
+    """Deletes cached verdicts (all of them, or only those older than the given age). Returns the count."""
+    with session_scope() as session:
+        query = session.query(JudgeVerdict)
+        if older_than_seconds is not None:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than_seconds)
+            query = query.filter(JudgeVerdict.created_at < cutoff)
+        return query.delete(synchronize_session=False)
+
+
+def count_cached_verdicts():
+    with session_scope() as session:
+        return session.query(JudgeVerdict).count()
+
+
+def get_attempts_after(last_id, limit):
+    """The next `limit` attempts with an id above `last_id`, in id order (for batch jobs)."""
+    with session_scope() as session:
+        return session.query(
+            Attempt.id, Attempt.session_id, Attempt.snippet_id, Attempt.error_type, Attempt.is_success, Attempt.timestamp
+        ).filter(Attempt.id > last_id).order_by(Attempt.id.asc()).limit(limit).all()
+
+
+def get_sessions_attempts(session_ids, up_to_id):
+    """Attempts of the given sessions with an id up to `up_to_id`, in id order."""
+    with session_scope() as session:
+        return session.query(
+            Attempt.id, Attempt.session_id, Attempt.snippet_id, Attempt.error_type, Attempt.is_success, Attempt.timestamp
+        ).filter(Attempt.session_id.in_(list(session_ids)), Attempt.id <= up_to_id).order_by(Attempt.id.asc()).all()
+
+
+def get_cohort_cursor(name="attempts"):
+    with session_scope() as session:
+        row = session.get(CohortCursor, name)
+        return row.last_attempt_id if row else 0
+
+
+def save_cohort_batch(last_id, new_last_id, stats, buckets, name="attempts"):
+    """
+    Adds one batch of cohort deltas and moves the high-water mark from `last_id` to
+    `new_last_id` in a single transaction. Returns False, writing nothing, if another
+    process has moved the mark since `last_id` was read.
+    stats: [{scope, key, attempts, successes, solved}], buckets: [{scope, key, metric, bucket, count}]
+    """
+    with session_scope() as session:
+        session.execute(sqlite_insert(CohortCursor).values(name=name, last_attempt_id=0).on_conflict_do_nothing())
+        moved = session.execute(update(CohortCursor).where(
+            CohortCursor.name == name, CohortCursor.last_attempt_id == last_id
+        ).values(last_attempt_id=new_last_id)).rowcount
+        if not moved:
+            return False
+
+        if stats:
+            stmt = sqlite_insert(CohortStat)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=["scope", "key"],
+                set_={c: getattr(CohortStat, c) + getattr(stmt.excluded, c) for c in ("attempts", "successes", "solved")},
+            ), stats)
+        if buckets:
+            stmt = sqlite_insert(CohortBucket)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=["scope", "key", "metric", "bucket"],
+                set_={"count": CohortBucket.count + stmt.excluded.count},
+            ), buckets)
+    return True
+
+
+def get_cohort_stats():
+    """All cohort rows: ([{scope, key, attempts, successes, solved}], [{scope, key, metric, bucket, count}])."""
+    with session_scope() as session:
+        stats = [{"scope": r.scope, "key": r.key, "attempts": r.attempts, "successes": r.successes, "solved": r.solved}
+                 for r in session.query(CohortStat)]
+        buckets = [{"scope": r.scope, "key": r.key, "metric": r.metric, "bucket": r.bucket, "count": r.count}
+                   for r in session.query(CohortBucket)]
+    return stats, buckets
+
+
+def get_attempt_outcomes():
+    """(ids, user ids, snippet ids, error types, successes) of every attempt, in id order (offline model fits)."""
+    with session_scope() as session:
+        rows = session.execute(select(Attempt.id, Attempt.user_id, Attempt.snippet_id, Attempt.error_type,
+                                      Attempt.is_success)
+                               .order_by(Attempt.id.asc())).all()
+    return tuple(map(list, zip(*rows))) if rows else ([], [], [], [], [])
+
+
+def get_knowledge_params():
+    """{skill: {p_init, p_learn, p_guess, p_slip}} for the skills that have been fitted."""
+    with session_scope() as session:
+        return {r.skill: {"p_init": r.p_init, "p_learn": r.p_learn, "p_guess": r.p_guess, "p_slip": r.p_slip}
+                for r in session.query(KnowledgeParam)}
+
+
+def save_knowledge_fit(params, states):
+    """
+    Stores a fit: params {skill: {p_init, p_learn, p_guess, p_slip, observations}} and
+    states [{user_id, skill, p_known, observations}], replacing the fitted skills' states.
+    """
+    with session_scope() as session:
+        for skill, p in params.items():
+            session.merge(KnowledgeParam(skill=skill, fitted_at=datetime.datetime.utcnow(), **p))
+        session.query(KnowledgeState).filter(KnowledgeState.skill.in_(list(params))).delete()
+        if states:
+            session.execute(insert(KnowledgeState), states)
+    cache = _request_cache.get()
+    if cache:
+        cache.clear()
+
+
+def get_mastery(user_id):
+    """{skill: probability mastered} for the skills with knowledge-tracing evidence (cached for the request)."""
+    return cached_for_request("mastery", user_id, lambda: load_mastery(user_id))
+
+
+def load_mastery(user_id):
+    with session_scope() as session:
+        return {r.skill: r.p_known for r in session.query(KnowledgeState).filter_by(user_id=user_id)}
+
+
+def set_mastery(user_id, skill, p_known):
+    """Stores a user's new mastery probability for a skill after one more attempt."""
+    invalidate_user(user_id, "mastery")
+    stmt = sqlite_insert(KnowledgeState).values(user_id=user_id, skill=skill, p_known=p_known, observations=1)
+    with session_scope() as session:
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "skill"],
+            set_={"p_known": stmt.excluded.p_known, "observations": KnowledgeState.observations + 1},
+        ))
@@ -0,0 +1,194 @@
+# Local stand-in for the parts of google.generativeai used by ui_logic:
+# configure, list_models, GenerativeModel.count_tokens and
+# GenerativeModel.generate_content (including stream=True).
+#
+# Enabled with the TUTOR_FAKE_GEMINI environment variable (see config.py):
+#   TUTOR_FAKE_GEMINI=1       (or replay) replay answers from the recording (canned answers if missing)
+#   TUTOR_FAKE_GEMINI=record  forward to the real API and append its answers to the recording
+# Latency and failure injection come from `settings` (or the FAKE_GEMINI_* variables).
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+import config
+
+MODE = "record" if config.FAKE_GEMINI_MODE == "record" else "replay"
+RECORDING_PATH = os.environ.get("TUTOR_FAKE_RECORDING", os.path.join(config.DATA_DIR, "gemini_recording.jsonl"))
+
+
+class FakeSettings:
+    def __init__(self):
+        # Full-response latency is lognormal around `latency_median` seconds
+        self.latency_median = float(os.environ.get("FAKE_GEMINI_LATENCY", 0.8))
+        self.latency_sigma = float(os.environ.get("FAKE_GEMINI_SIGMA", 0.5))
+        self.first_chunk_fraction = 0.3
+        self.chunk_count = 4
+
+        # Failure injection: probability per call, and keys that always fail
+        self.error_rate = float(os.environ.get("FAKE_GEMINI_ERROR_RATE", 0.0))  # 503
+        self.rate_limit_rate = float(os.environ.get("FAKE_GEMINI_429_RATE", 0.0))  # 429
+        self.failing_keys = set(filter(None, os.environ.get("FAKE_GEMINI_BAD_KEYS", "").split(",")))
+
+        self.models = ["models/gemini-1.5-flash", "models/gemini-1.5-pro"]
+        self.seed = os.environ.get("FAKE_GEMINI_SEED")
+
+    def sample_latency(self, rng):
+        return rng.lognormvariate(0, self.latency_sigma) * self.latency_median
+
+
+settings = FakeSettings()
+_rng = random.Random(settings.seed)
+_rng_lock = threading.Lock()
+
+
+class FakeAPIError(Exception):
+    """Carries an HTTP status in `.code`, like google.api_core errors."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class Recording:
+    """Prompt-hash -> answers, stored as JSON lines."""
+
+    def __init__(self, path=RECORDING_PATH):
+        self.path = path
+        self._answers = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self._answers.setdefault(row["prompt_hash"], []).append(row["text"])
+
+    @staticmethod
+    def prompt_hash(prompt):
+        normalized = " ".join(str(prompt).split())
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def lookup(self, prompt):
+        answers = self._answers.get(self.prompt_hash(prompt))
+        return answers[0] if answers else None
+
+    def record(self, prompt, text):
+        row = {"prompt_hash": self.prompt_hash(prompt), "text": text}
+        with self._lock:
+            self._answers.setdefault(row["prompt_hash"], []).append(text)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+
+
+recording = Recording()
+
+
+def canned_answer(prompt):
+    """Plausible answer for prompts that were never recorded."""
+    if "OUTPUT FORMAT:" in prompt:
+        return "YES: Nice work, that fixes it!"
+    if "AUTOMATED TESTS:" in prompt:
+        return "Well done, your fix passes the checks." if "PASSED" in prompt else "Close! Re-check what the failing test expects."
+    if "Summarize this tutoring conversation" in prompt:
+        return "The student is working through the bug and has asked for guidance on one line."
+    return "What do you expect this line to do, and what does it actually do when you trace it?"
+
+
+# SDK surface
+_configured_key = None
+
+
+def configure(api_key=None, **kwargs):
+    global _configured_key
+    _configured_key = api_key
+    if MODE == "record":
+        _real().configure(api_key=api_key, **kwargs)
+
+
+def _real():
+    import google.generativeai
+    return google.generativeai
+
+
+def list_models():
+    _check_key(_configured_key)
+    if MODE == "record":
+        return list(_real().list_models())
+    return [SimpleNamespace(name=m, supported_generation_methods=["generateContent", "countTokens"])
+            for m in settings.models]
+
+
+def _check_key(key):
+    if key in settings.failing_keys:
+        raise FakeAPIError(403, "API key not valid.")
+
+
+def _roll_failure():
+    with _rng_lock:
+        roll = _rng.random()
+    if roll < settings.rate_limit_rate:
+        raise FakeAPIError(429, "Resource has been exhausted (e.g. check quota).")
+    if roll < settings.rate_limit_rate + settings.error_rate:
+        raise FakeAPIError(503, "The service is currently unavailable.")
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+        self._api_key = None
+
+    def _key(self):
+        # Like the SDK, a model keeps the key that was configured when it first made a request
+        if self._api_key is None:
+            self._api_key = _configured_key
+        return self._api_key
+
+    def count_tokens(self, contents=(), **kwargs):
+        _check_key(self._key())
+        return SimpleNamespace(total_tokens=len(str(contents).split()))
+
+    def _answer(self, prompt):
+        if MODE == "record":
+            _real().configure(api_key=self._key())
+            text = _real().GenerativeModel(self.model_name).generate_content(prompt).text
+            recording.record(prompt, text)
+            return text
+        return recording.lookup(prompt) or canned_answer(prompt)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._stream(prompt)
+
+        _check_key(self._key())
+        with _rng_lock:
+            latency = settings.sample_latency(_rng)
+        time.sleep(latency)
+        _roll_failure()
+        return FakeResponse(self._answer(prompt))
+
+    def _stream(self, prompt):
+        # Like the SDK, nothing happens until the first chunk is requested
+        _check_key(self._key())
+        with _rng_lock:
+            latency = settings.sample_latency(_rng)
+        time.sleep(latency * settings.first_chunk_fraction)
+        _roll_failure()
+
+        text = self._answer(prompt)
+        words = text.split(" ")
+        size = max(1, -(-len(words) // settings.chunk_count))
+        pieces = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+        pause = latency * (1 - settings.first_chunk_fraction) / max(1, len(pieces) - 1)
+
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(pause)
+            yield FakeResponse(piece + (" " if i < len(pieces) - 1 else ""))
@@ -0,0 +1,48 @@
+import re
+import threading
+from collections import deque
+from taxonomy import get_question_templates
+
+NAME_PLACEHOLDER = "<<USER_NAME>>"
+
+
+class LocalTutor:
+    """
+    Answers the student from local material when Gemini is slow or offline:
+    earlier LLM replies for the same phase and snippet, the taxonomy's
+    question templates, and the snippet's own hint.
+    """
+
+    def __init__(self, max_per_key=5):
+        self.max_per_key = max_per_key
+        self._recent = {}  # (phase, snippet id or error type) -> deque of earlier LLM replies
+        self._lock = threading.Lock()
+
+    def remember(self, phase, topic_key, reply, user_name=""):
+        """Keeps a successful LLM reply (with the name made generic) for reuse as a fallback."""
+        if not reply or reply.startswith("AI Error"):
+            return
+        if user_name and len(user_name.strip()) > 1:
+            reply = re.sub(rf"\b{re.escape(user_name.strip())}\b", NAME_PLACEHOLDER, reply)
+        with self._lock:
+            self._recent.setdefault((phase, topic_key), deque(maxlen=self.max_per_key)).append(reply)
+
+    def reply(self, messages, phase, topic_key, error_type, hint=None, user_name="there"):
+        """A Socratic reply that doesn't repeat anything already said in this chat."""
+        said = {m["content"] for m in messages if m["role"] == "assistant"}
+        turn = sum(1 for m in messages if m["role"] == "assistant")
+
+        with self._lock:
+            cached = list(self._recent.get((phase, topic_key), []))
+        fresh = [r.replace(NAME_PLACEHOLDER, user_name) for r in reversed(cached)]
+        fresh = [r for r in fresh if r not in said]
+        if fresh:
+            return fresh[0]
+
+        templates = [t.format(name=user_name) for t in get_question_templates(error_type)]
+        unused = [t for t in templates if t not in said]
+        question = unused[0] if unused else templates[turn % len(templates)]
+
+        if hint and not any(hint in s for s in said):
+            return f"{question} (Hint: {hint})"
+        return question
@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+import config
+
+
+def get_status_code(exc):
+    """HTTP status of a google.api_core error (or anything exposing .code), else None."""
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code
+    code = getattr(code, "value", None)  # grpc.StatusCode enum
+    if isinstance(code, tuple):
+        code = code[0]
+    return {8: 429, 14: 503, 13: 500, 4: 504, 16: 401, 7: 403}.get(code)
+
+
+class KeyState:
+    """Rate limit, circuit breaker and health counters for one API key."""
+
+    def __init__(self, key, burst):
+        self.key = key
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_used = 0.0
+
+        # Health stats
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.avg_latency = None
+        self.last_error = None
+
+    def refill(self, now, rate_per_sec, burst):
+        self.tokens = min(burst, self.tokens + (now - self.refilled_at) * rate_per_sec)
+        self.refilled_at = now
+
+    def state(self, now):
+        if now < self.open_until:
+            return "open"
+        if self.consecutive_failures:
+            return "half_open"
+        return "closed"
+
+
+class KeyPool:
+    """
+    Process-wide pool of Gemini API keys.
+    Each key has a token bucket (requests per minute) and a circuit breaker
+    that opens on 429/5xx with an exponential cool-down. Callers get the
+    least-loaded key that is healthy and has quota left.
+    """
+
+    def __init__(self, keys,
+                 rate_per_minute=config.KEY_RATE_PER_MINUTE,
+                 burst=config.KEY_BURST,
+                 cooldown_base=config.KEY_COOLDOWN_BASE,
+                 cooldown_max=config.KEY_COOLDOWN_MAX):
+        self.rate_per_sec = rate_per_minute / 60.0
+        self.burst = burst
+        self.cooldown_base = cooldown_base
+        self.cooldown_max = cooldown_max
+
+        # Skip the placeholder entries in config.GEMINI_KEYS
+        self.keys = [k for k in keys if isinstance(k, str) and k]
+        self._states = {k: KeyState(k, burst) for k in self.keys}
+        self._cond = threading.Condition()
+
+    def _pick(self, now, exclude):
+        candidates = []
+        for key, s in self._states.items():
+            if key in exclude:
+                continue
+            s.refill(now, self.rate_per_sec, self.burst)
+            state = s.state(now)
+            if state == "open" or s.tokens < 1.0:
+                continue
+            if state == "half_open" and s.in_flight:
+                continue  # Only one trial request while half-open
+            candidates.append(s)
+
+        if not candidates:
+            return None
+        return min(candidates, key=lambda s: (s.in_flight, -s.tokens, s.last_used))
+
+    def _next_ready_in(self, now, exclude):
+        """
+        Seconds until some non-excluded key could be picked, math.inf if only a
+        release can free one (a half-open key with its trial request in flight),
+        or None if none ever will.
+        """
+        waits = []
+        for key, s in self._states.items():
+            if key in exclude:
+                continue
+            if s.state(now) == "half_open" and s.in_flight:
+                waits.append(math.inf)  # release() notifies when the trial request ends
+                continue
+            token_wait = max(0.0, (1.0 - s.tokens) / self.rate_per_sec) if self.rate_per_sec else None
+            if token_wait is None:
+                continue
+            waits.append(max(token_wait, s.open_until - now))
+        return min(waits) if waits else None
+
+    def acquire(self, exclude=(), timeout=config.KEY_ACQUIRE_TIMEOUT):
+        """
+        Reserves a key for one request, waiting up to `timeout` seconds for quota.
+        Returns None if no key becomes available in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                s = self._pick(now, exclude)
+                if s:
+                    return self._reserve(s, now)
+
+                wait = self._next_ready_in(now, exclude)
+                remaining = deadline - now
+                if wait is None or remaining <= 0 or (wait != math.inf and wait > remaining):
+                    return None
+                self._cond.wait(min(max(wait, 0.01), remaining))
+
+    def try_acquire(self, exclude=()):
+        """
+        Non-blocking acquire, for callers that wait their own way (the async client).
+        Returns (key, None), or (None, wait) with wait as in _next_ready_in.
+        """
+        with self._cond:
+            now = time.monotonic()
+            s = self._pick(now, exclude)
+            if s:
+                return self._reserve(s, now), None
+            return None, self._next_ready_in(now, exclude)
+
+    def _reserve(self, s, now):
+        s.tokens -= 1.0
+        s.in_flight += 1
+        s.requests += 1
+        s.last_used = now
+        return s.key
+
+    def release(self, key, success, error=None, latency=None):
+        """
+        Reports the outcome of a request made with `key`.
+        success=None (a cancelled request) only frees the slot: no health change.
+        """
+        with self._cond:
+            s = self._states.get(key)
+            if s is None:
+                return
+            s.in_flight = max(0, s.in_flight - 1)
+
+            if latency is not None:
+                s.avg_latency = latency if s.avg_latency is None else 0.8 * s.avg_latency + 0.2 * latency
+
+            if success:
+                s.successes += 1
+                s.consecutive_failures = 0
+                s.open_until = 0.0
+            elif success is not None:
+                s.failures += 1
+                s.last_error = str(error)[:120] if error else None
+                status = get_status_code(error)
+
+                # 429 / 5xx: back off exponentially. 401 / 403: the key itself is bad.
+                if status in (401, 403):
+                    s.consecutive_failures += 1
+                    s.open_until = time.monotonic() + self.cooldown_max
+                elif status is None or status == 429 or status >= 500:
+                    s.consecutive_failures += 1
+                    cooldown = min(self.cooldown_max, self.cooldown_base * 2 ** (s.consecutive_failures - 1))
+                    s.open_until = time.monotonic() + cooldown
+            self._cond.notify_all()
+
+    def stats(self):
+        """Health snapshot of every key (key shown by suffix only)."""
+        now = time.monotonic()
+        with self._cond:
+            rows = []
+            for s in self._states.values():
+                s.refill(now, self.rate_per_sec, self.burst)
+                rows.append({
+                    "key": f"...{s.key[-4:]}",
+                    "state": s.state(now),
+                    "tokens": round(s.tokens, 2),
+                    "in_flight": s.in_flight,
+                    "requests": s.requests,
+                    "successes": s.successes,
+                    "failures": s.failures,
+                    "cooldown_left": round(max(0.0, s.open_until - now), 1),
+                    "avg_latency": round(s.avg_latency, 3) if s.avg_latency is not None else None,
+                    "last_error": s.last_error,
+                })
+            return rows
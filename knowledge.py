@@ -0,0 +1,260 @@
+"""
+Bayesian Knowledge Tracing over the five skills.
+
+Each submitted fix is evidence about one skill: the main skill (largest skill
+reward) of the snippet it fixed, or for the user's own code, the main skill of
+most snippets with the detected error type. Per skill, a student either knows it or not, may learn it after
+any attempt (p_learn), and answers correctly by guessing (p_guess) or wrongly by
+slipping (p_slip). The parameters are fitted offline with EM over every student's
+attempts (fit_em, vectorized with NumPy); a student's mastery is then updated
+online in O(1) per attempt (update).
+
+    python knowledge.py          # fit from the database and recompute every student's mastery
+"""
+import json
+import time
+import config
+import database
+
+SKILLS = list(database.SKILL_COLUMNS)
+
+# Keeps EM away from degenerate fits (e.g. "everyone knows it and slips half the time")
+PARAM_BOUNDS = {"p_init": (0.01, 0.99), "p_learn": (0.01, 0.5), "p_guess": (0.01, 0.35), "p_slip": (0.01, 0.35)}
+
+
+def main_skill(snippet):
+    """The skill a snippet mostly exercises (largest skill reward), or None."""
+    rewards = {k: v for k, v in (snippet or {}).get("skill_rewards", {}).items() if k in database.SKILL_COLUMNS}
+    if not rewards or max(rewards.values()) <= 0:
+        return None
+    return max(rewards, key=rewards.get)
+
+
+def load_attempt_skills(path=config.JSON_PATH):
+    """({snippet id: main skill}, {error type: main skill of most of its snippets}) for the snippet database."""
+    with open(path, "r", encoding="utf-8") as f:
+        snippets = json.load(f)["snippets"]
+    by_snippet = {s["id"]: main_skill(s) for s in snippets if main_skill(s)}
+
+    votes = {}
+    for s in snippets:
+        if main_skill(s) and s.get("error_type"):
+            counts = votes.setdefault(s["error_type"], {})
+            counts[main_skill(s)] = counts.get(main_skill(s), 0) + 1
+    by_error_type = {error_type: max(counts, key=counts.get) for error_type, counts in votes.items()}
+    return by_snippet, by_error_type
+
+
+def attempt_skill(snippet_id, error_type, attempt_skills):
+    """
+    The skill a logged fix counts for (see load_attempt_skills), or None. Only the step 3
+    fix of the user's own code is logged as USER_INPUT with an error type; the step 1
+    analysis log has none and counts for nothing.
+    """
+    by_snippet, by_error_type = attempt_skills
+    if snippet_id and snippet_id != "USER_INPUT":
+        return by_snippet.get(snippet_id)
+    return by_error_type.get(error_type)
+
+
+def update(p_known, correct, params):
+    """Mastery after one more attempt: Bayes on the outcome, then the chance to learn."""
+    if correct:
+        known = p_known * (1 - params["p_slip"])
+        posterior = known / (known + (1 - p_known) * params["p_guess"])
+    else:
+        known = p_known * params["p_slip"]
+        posterior = known / (known + (1 - p_known) * (1 - params["p_guess"]))
+    return posterior + (1 - posterior) * params["p_learn"]
+
+
+def time_major(seq):
+    """
+    Layout for stepping through every sequence at once. `seq` labels each observation
+    with its sequence, grouped and in time order. Sequences are ranked longest first,
+    so the ones still running at step t are the first active[t] ranks and step t is the
+    slice offsets[t]:offsets[t + 1] of the time-major arrays. Returns (index into the
+    input per time-major position, active, offsets, sequence per rank, length per rank).
+    """
+    import numpy as np
+
+    starts = np.flatnonzero(np.r_[True, seq[1:] != seq[:-1]])
+    lengths = np.diff(np.r_[starts, len(seq)])
+    order = np.argsort(-lengths, kind="stable")
+    ranked_starts, ranked_lengths = starts[order], lengths[order]
+
+    steps = np.arange(ranked_lengths[0])
+    active = len(order) - np.searchsorted(ranked_lengths[::-1], steps, side="right")
+    offsets = np.r_[0, np.cumsum(active)]
+    index = np.concatenate([ranked_starts[:k] + t for t, k in enumerate(active)])
+    return index, active, offsets, order, ranked_lengths
+
+
+def forward(p, obs, active, offsets, prior, post):
+    """Fills P(known) before (`prior`) and after (`post`) each time-major observation. Returns the log-likelihood."""
+    import numpy as np
+
+    e_known = np.where(obs, 1 - p["p_slip"], p["p_slip"])
+    e_unknown = np.where(obs, p["p_guess"], 1 - p["p_guess"])
+    ll = 0.0
+    for t, k in enumerate(active):
+        a = offsets[t]
+        if t == 0:
+            before = np.full(k, p["p_init"])
+        else:
+            before = post[offsets[t - 1]:offsets[t - 1] + k] * (1 - p["p_learn"]) + p["p_learn"]
+        known = before * e_known[a:a + k]
+        evidence = known + (1 - before) * e_unknown[a:a + k]
+        prior[a:a + k] = before
+        post[a:a + k] = known / evidence
+        ll += np.log(evidence).sum()
+    return ll
+
+
+def fit_em(seq, correct, params=None, iterations=config.KT_EM_ITERATIONS, tolerance=config.KT_EM_TOLERANCE,
+           max_steps=config.KT_EM_MAX_STEPS):
+    """
+    Fits one skill's parameters with EM (Baum-Welch for the two-state model).
+    `seq` and `correct` are arrays with one entry per attempt, grouped by sequence
+    (student) and in time order within it. Every step of the forward and backward
+    passes runs over all sequences at once, so the Python loop is only as long as
+    the longest sequence; EM sees at most the first `max_steps` attempts of each
+    one, and only the final mastery pass walks the full length.
+    Returns (params, mastery after each sequence, iterations run).
+    """
+    import numpy as np
+
+    seq = np.asarray(seq)
+    correct = np.asarray(correct, dtype=bool)
+    full = time_major(seq)
+    if max_steps and full[4][0] > max_steps:
+        # A few very long sequences would add Python steps to every pass while barely moving the fit
+        starts = np.flatnonzero(np.r_[True, seq[1:] != seq[:-1]])
+        position = np.arange(len(seq)) - np.repeat(starts, np.diff(np.r_[starts, len(seq)]))
+        keep = position < max_steps
+        index, active, offsets, _, _ = time_major(seq[keep])
+        obs = correct[keep][index]
+    else:
+        index, active, offsets, _, _ = full
+        obs = correct[index]
+    n = len(obs)
+    has_next = np.zeros(n, dtype=bool)
+    for t in range(len(active) - 1):
+        has_next[offsets[t]:offsets[t] + active[t + 1]] = True
+
+    p = dict(params or config.KT_DEFAULT_PARAMS)
+    prior, post = np.empty(n), np.empty(n)
+    last_ll = -np.inf
+    for iteration in range(1, iterations + 1):
+        ll = forward(p, obs, active, offsets, prior, post)
+
+        # Backward: smoothed P(known) and P(learned between t and t+1). Known is absorbing,
+        # so P(known at t | known at t+1) = post_t / prior_t+1 and unknown at t+1 implies unknown at t
+        gamma, learned = post.copy(), np.zeros(n)
+        for t in range(len(active) - 2, -1, -1):
+            a, a1, k1 = offsets[t], offsets[t + 1], active[t + 1]
+            ratio = gamma[a1:a1 + k1] / prior[a1:a1 + k1]
+            gamma[a:a + k1] = post[a:a + k1] * ratio
+            learned[a:a + k1] = (1 - post[a:a + k1]) * p["p_learn"] * ratio
+
+        # M-step
+        unknown = 1 - gamma
+        p = {
+            "p_init": gamma[:offsets[1]].mean(),
+            "p_learn": learned.sum() / max(unknown[has_next].sum(), 1e-12),
+            "p_guess": (unknown * obs).sum() / max(unknown.sum(), 1e-12),
+            "p_slip": (gamma * ~obs).sum() / max(gamma.sum(), 1e-12),
+        }
+        p = {name: float(np.clip(v, *PARAM_BOUNDS[name])) for name, v in p.items()}
+
+        if ll - last_ll < tolerance * n:
+            break
+        last_ll = ll
+
+    # Mastery after each sequence's last attempt with the fitted parameters, back in input order
+    index, active, offsets, order, ranked_lengths = full
+    obs = correct[index]
+    prior, post = np.empty(len(obs)), np.empty(len(obs))
+    forward(p, obs, active, offsets, prior, post)
+    final = post[offsets[ranked_lengths - 1] + np.arange(len(order))]
+    mastery = np.empty(len(order))
+    mastery[order] = final + (1 - final) * p["p_learn"]
+    return p, mastery, iteration
+
+
+def fit_all(attempt_skills=None):
+    """
+    Fits every skill from all attempts in the database and recomputes each student's
+    mastery from their history. Attempts logged while it runs are not in the new states.
+    Returns {skill: (params, observations, iterations)}.
+    """
+    import numpy as np
+
+    attempt_skills = attempt_skills if attempt_skills is not None else load_attempt_skills()
+    _, user_ids, snippet_ids, error_types, successes = database.get_attempt_outcomes()
+    skills = np.array([attempt_skill(s, e, attempt_skills) or "" for s, e in zip(snippet_ids, error_types)])
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    successes = np.asarray(successes, dtype=bool)
+    current = database.get_knowledge_params()
+
+    params, states, report = {}, [], {}
+    for skill in SKILLS:
+        rows = np.flatnonzero(skills == skill)
+        if not len(rows):
+            continue
+        # Group by student; the stable sort keeps each student's attempts in id (time) order
+        rows = rows[np.argsort(user_ids[rows], kind="stable")]
+        seq = user_ids[rows]
+        p, mastery, iterations = fit_em(seq, successes[rows], current.get(skill))
+
+        students, counts = np.unique(seq, return_counts=True)
+        params[skill] = {**p, "observations": int(len(rows))}
+        states += [{"user_id": int(u), "skill": skill, "p_known": float(m), "observations": int(c)}
+                   for u, m, c in zip(students, mastery, counts)]
+        report[skill] = (p, len(rows), iterations)
+
+    database.save_knowledge_fit(params, states)
+    return report
+
+
+class KnowledgeTracer:
+    """Online side: updates a student's mastery of the attempted snippet's skill after each attempt."""
+
+    def __init__(self):
+        self.attempt_skills = load_attempt_skills()
+        self.reload()
+
+    def reload(self):
+        """Picks up the parameters of the latest fit (defaults for skills never fitted)."""
+        fitted = database.get_knowledge_params()
+        self.params = {skill: fitted.get(skill, config.KT_DEFAULT_PARAMS) for skill in SKILLS}
+
+    def record(self, user_id, snippet_id, error_type, correct):
+        """
+        O(1) update for one logged fix, counted for the same skill as in fit_all.
+        Returns the skill it counted for, or None.
+        """
+        skill = attempt_skill(snippet_id, error_type, self.attempt_skills)
+        if not skill:
+            return None
+        p_known = database.get_mastery(user_id).get(skill, self.params[skill]["p_init"])
+        database.set_mastery(user_id, skill, update(p_known, correct, self.params[skill]))
+        return skill
+
+    def mastery(self, user_id):
+        """
+        {skill: probability mastered} for all five skills (the fitted prior for skills
+        without evidence), or None if the student has no knowledge-tracing evidence yet.
+        """
+        known = database.get_mastery(user_id)
+        if not known:
+            return None
+        return {skill: known.get(skill, self.params[skill]["p_init"]) for skill in SKILLS}
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    for skill, (p, observations, iterations) in fit_all().items():
+        print(f"✅ {skill:<16} {observations:>8} attempts, {iterations:>2} EM iterations: "
+              + ", ".join(f"{k}={v:.3f}" for k, v in p.items()))
+    print(f"✅ Knowledge tracing fitted in {time.perf_counter() - started:.1f}s.")
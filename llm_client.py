@@ -0,0 +1,172 @@
+import asyncio
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+
+def _discard_result(future):
+    if not future.cancelled():
+        future.exception()  # Retrieved, so asyncio doesn't log it as unhandled
+
+
+class AsyncLLMClient:
+    """
+    asyncio layer over the key pool with the same semantics as
+    generate_content_with_rotation: try healthy keys until one answers.
+
+    - A semaphore caps the Gemini calls running at once for the process.
+      Every launched attempt holds a slot until its thread finishes, including
+      hedges and attempts that lost or outlived the deadline. Streamed replies,
+      which run outside the client, hold one too (acquire_slot / release_slot).
+    - Each call has a deadline covering all of its retries.
+    - With hedging, if the first key hasn't answered after the observed p95
+      latency, a second key is fired and the first answer wins.
+
+    `call(key, prompt)` is the blocking SDK call. It runs on the client's own
+    bounded thread pool (one thread per semaphore slot), never on the default
+    executor. Waiting for key quota is an asyncio sleep, not a blocked thread.
+
+    Pass a `trace` dict to learn how many keys were tried ("attempts") and
+    which one answered ("key").
+    """
+
+    def __init__(self, pool, call,
+                 max_concurrency=config.LLM_MAX_CONCURRENCY,
+                 deadline=config.LLM_DEADLINE,
+                 hedge=config.LLM_HEDGE,
+                 hedge_delay=config.LLM_HEDGE_DELAY):
+        self.pool = pool
+        self.call = call
+        self.deadline = deadline
+        self.hedge = hedge
+        self.default_hedge_delay = hedge_delay
+        self._latencies = deque(maxlen=200)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-call")
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True).start()
+
+    def hedge_delay(self):
+        """p95 of recent successful latencies, or the configured default until there is enough data."""
+        if len(self._latencies) < config.LLM_HEDGE_MIN_SAMPLES:
+            return self.default_hedge_delay
+        return statistics.quantiles(self._latencies, n=20)[18]
+
+    def _call_and_release(self, key, prompt):
+        # Runs on a worker thread; reports to the pool even if the caller gave up
+        start = time.perf_counter()
+        try:
+            response = self.call(key, prompt)
+        except Exception as e:
+            self.pool.release(key, success=False, error=e)
+            print(f"⚠️ Key failed: {str(e)[:50]}... Rotation to next.")
+            raise
+        latency = time.perf_counter() - start
+        self._latencies.append(latency)
+        self.pool.release(key, success=True, latency=latency)
+        return key, response
+
+    async def _acquire_key(self, tried, wait):
+        """Reserves a key not in `tried`, sleeping on the loop up to `wait` seconds for quota."""
+        deadline = time.monotonic() + wait
+        while True:
+            key, ready_in = self.pool.try_acquire(tried)
+            remaining = deadline - time.monotonic()
+            if key or ready_in is None or remaining <= 0 or (ready_in != math.inf and ready_in > remaining):
+                return key
+            await asyncio.sleep(min(max(ready_in, 0.01), remaining, config.LLM_KEY_POLL_INTERVAL))
+
+    async def _launch(self, prompt, tried, wait):
+        # A hedge (wait=0) is only worth it if a slot is free right now
+        if not wait and self._semaphore.locked():
+            return None
+        await self._semaphore.acquire()
+        try:
+            key = await self._acquire_key(tried, wait)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        if key is None:
+            self._semaphore.release()
+            return None
+
+        tried.add(key)
+        future = self._executor.submit(self._call_and_release, key, prompt)
+        # The slot is held until the thread is done, even if the caller stops waiting
+        future.add_done_callback(lambda _: self._loop.call_soon_threadsafe(self._semaphore.release))
+        return asyncio.wrap_future(future, loop=self._loop)
+
+    async def _race(self, prompt, hedge, trace):
+        tried = set()
+        pending = set()
+        hedged = False
+
+        try:
+            first = await self._launch(prompt, tried, config.KEY_ACQUIRE_TIMEOUT)
+            if first is None:
+                raise Exception("All API keys failed.")
+            pending.add(first)
+
+            while pending:
+                timeout = self.hedge_delay() if hedge and not hedged and len(pending) == 1 else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Slow first attempt: hedge on another key, without waiting for quota
+                    hedged = True
+                    extra = await self._launch(prompt, tried, 0)
+                    if extra:
+                        pending.add(extra)
+                    continue
+
+                for task in done:
+                    if task.exception() is None:
+                        trace["key"], response = task.result()
+                        return response
+
+                # Failover: keep one attempt in flight while untried keys remain
+                if not pending and len(tried) < len(self.pool.keys):
+                    nxt = await self._launch(prompt, tried, config.KEY_ACQUIRE_TIMEOUT)
+                    if nxt:
+                        pending.add(nxt)
+
+            raise Exception("All API keys failed.")
+        finally:
+            trace["attempts"] = len(tried)
+            # Losers keep running (a started SDK call can't be stopped); they release their key and slot when done
+            for task in pending:
+                task.add_done_callback(_discard_result)
+
+    async def generate(self, prompt, deadline=None, hedge=None, trace=None):
+        hedge = self.hedge if hedge is None else hedge
+        trace = {} if trace is None else trace
+        try:
+            return await asyncio.wait_for(self._race(prompt, hedge, trace), timeout=deadline or self.deadline)
+        except asyncio.TimeoutError:
+            raise Exception(f"Gemini did not answer within {deadline or self.deadline}s.")
+
+    def acquire_slot(self, timeout=config.KEY_ACQUIRE_TIMEOUT):
+        """
+        Takes a concurrency slot for a call made outside the client (a stream), waiting
+        up to `timeout` seconds. Returns False if none came free; else call release_slot() when done.
+        """
+        async def take():
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+        return asyncio.run_coroutine_threadsafe(take(), self._loop).result()
+
+    def release_slot(self):
+        self._loop.call_soon_threadsafe(self._semaphore.release)
+
+    def generate_sync(self, prompt, deadline=None, hedge=None, trace=None):
+        """Blocking entry point for the Streamlit script thread."""
+        future = asyncio.run_coroutine_threadsafe(self.generate(prompt, deadline, hedge, trace), self._loop)
+        return future.result()
@@ -0,0 +1,130 @@
+import argparse
+import math
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+STEPS = ["login", "dashboard", "analyze", "warmup", "fix"]
+
+BUGGY_CODE = "i = 0\nwhile i < 5:\n    print(i)"
+FIXED_CODE = "i = 0\nwhile i < 5:\n    print(i)\n    i += 1"
+QUESTION = "Which line should I look at first?"
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def click(at, label, sidebar=False):
+    buttons = at.sidebar.button if sidebar else at.button
+    for button in buttons:
+        if button.label == label:
+            return button.click().run()
+    raise LookupError(f"No button labelled {label!r} at step {at.session_state['step']!r}")
+
+
+def fill(widgets, label, value):
+    for widget in widgets:
+        if widget.label == label:
+            widget.set_value(value)
+            return
+    raise LookupError(f"No input labelled {label!r}")
+
+
+def timed(timings, step, action):
+    start = time.perf_counter()
+    result = action()
+    timings[step] = time.perf_counter() - start
+    return result
+
+
+def simulate_student(timeout):
+    """Drives one student through login -> analyze -> warm-up -> fix. Returns {step: seconds}."""
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    username = f"load_{uuid.uuid4().hex[:10]}"
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"),
+                           default_timeout=timeout)
+    at.run()
+
+    # Login (registration logs the student in)
+    at.radio(key="auth_mode_select").set_value("Register").run()
+    fill(at.text_input, "New Username", username)
+    fill(at.text_input, "New Password", "load-test")
+    fill(at.text_input, "Display Name", "Load Tester")
+    timed(timings, "login", lambda: click(at, "Create Account"))
+    timed(timings, "dashboard", lambda: click(at, "⏩ Skip Calibration", sidebar=True))
+
+    # Analyze
+    click(at, "➕ Start New Analysis")
+    fill(at.text_area, "Paste Buggy Code", BUGGY_CODE)
+    timed(timings, "analyze", lambda: click(at, "Analyze"))
+
+    # Warm-up chat
+    timed(timings, "warmup", lambda: at.chat_input[0].set_value(QUESTION).run())
+
+    # Fix
+    click(at, "✅ I understand → Fix mine")
+    fill(at.text_area, "Editor", FIXED_CODE)
+    timed(timings, "fix", lambda: click(at, "Submit Fix"))
+
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return timings
+
+
+def print_report(results, errors, elapsed):
+    print(f"\n{'step':<10} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8}   (seconds)")
+    for step in STEPS:
+        values = [r[step] for r in results if step in r]
+        if values:
+            print(f"{step:<10} {len(values):>5} {percentile(values, 50):>8.3f} "
+                  f"{percentile(values, 95):>8.3f} {percentile(values, 99):>8.3f}")
+
+    print(f"\nStudents completed: {len(results)} | Errors: {len(errors)} | Wall time: {elapsed:.1f}s")
+    print(f"Throughput: {len(results) / elapsed * 60:.1f} students/min")
+    for e in errors[:5]:
+        print(f"  ❌ {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive simulated students through the tutor with AppTest.")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds allowed per script run")
+    parser.add_argument("--real", action="store_true", help="Use the real Gemini API (burns quota!)")
+    parser.add_argument("--latency", type=float, help="Fake Gemini median latency (seconds)")
+    parser.add_argument("--error-rate", type=float, help="Fake Gemini 503 probability per call")
+    parser.add_argument("--rate-limit-rate", type=float, help="Fake Gemini 429 probability per call")
+    args = parser.parse_args()
+
+    # Must be set before the app (and so config / fake_gemini) is first imported
+    if not args.real and os.environ.get("TUTOR_FAKE_GEMINI") != "record":
+        os.environ["TUTOR_FAKE_GEMINI"] = "1"
+    for flag, var in [("latency", "FAKE_GEMINI_LATENCY"), ("error_rate", "FAKE_GEMINI_ERROR_RATE"),
+                      ("rate_limit_rate", "FAKE_GEMINI_429_RATE")]:
+        if getattr(args, flag) is not None:
+            os.environ[var] = str(getattr(args, flag))
+
+    # One untimed student loads the retriever model and other cached resources
+    print("⏳ Warming up...")
+    simulate_student(args.timeout)
+
+    results, errors = [], []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(simulate_student, args.timeout) for _ in range(args.students)]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(str(e)[:200])
+    print_report(results, errors, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from chat_history import estimate_tokens
+import config
+
+# Upper bounds of the histogram buckets (the last bucket is open-ended)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are read as the upper bound of the matching bucket."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        labels = [str(b) for b in self.bounds] + ["+Inf"]
+        return {"buckets": dict(zip(labels, self.counts)), "count": self.count, "sum": round(self.total, 4)}
+
+
+def key_suffix(key):
+    return f"...{key[-4:]}" if key else None
+
+
+def token_counts(prompt, response=None, text=""):
+    """(prompt tokens, response tokens) from the SDK's usage metadata, or estimated from the text."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    if prompt_tokens:
+        return prompt_tokens, getattr(usage, "candidates_token_count", 0) or 0
+
+    if not text and response is not None:
+        try:
+            text = response.text or ""
+        except ValueError:
+            text = ""
+    return estimate_tokens(str(prompt)), estimate_tokens(text) if text else 0
+
+
+class CallSeries:
+    """Aggregates for one (operation, model, key) combination."""
+
+    def __init__(self):
+        self.outcomes = {}
+        self.retries = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.first_chunk = Histogram(LATENCY_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.response_tokens = Histogram(TOKEN_BUCKETS)
+
+    def to_dict(self):
+        return {
+            "outcomes": dict(self.outcomes),
+            "retries": self.retries,
+            "latency_seconds": self.latency.to_dict(),
+            "first_chunk_seconds": self.first_chunk.to_dict(),
+            "prompt_tokens": self.prompt_tokens.to_dict(),
+            "response_tokens": self.response_tokens.to_dict(),
+        }
+
+
+class LLMMetrics:
+    """
+    Per-call Gemini instrumentation: wall time, retries, serving key and model,
+    token counts and outcome, aggregated into histograms. User-facing stages
+    (tutor reply, judge) are timed separately by outcome.
+
+    The aggregates are written to `path` as JSON at most every `flush_interval`
+    seconds, so they can be scraped or inspected without the UI.
+    """
+
+    def __init__(self, path=config.METRICS_PATH, flush_interval=config.METRICS_FLUSH_INTERVAL, recent=50):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.started_at = time.time()
+        self.recent = deque(maxlen=recent)
+        self._series = {}  # (operation, model, key suffix) -> CallSeries
+        self._stages = {}  # stage -> (outcome counts, Histogram)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush, True)
+
+    def record_call(self, operation, seconds, outcome, key=None, model=None, retries=0,
+                    prompt_tokens=0, response_tokens=0, first_chunk=None, error=None):
+        suffix = key_suffix(key)
+        with self._lock:
+            series = self._series.setdefault((operation, model, suffix), CallSeries())
+            series.outcomes[outcome] = series.outcomes.get(outcome, 0) + 1
+            series.retries += retries
+            series.latency.observe(seconds)
+            if first_chunk is not None:
+                series.first_chunk.observe(first_chunk)
+            if prompt_tokens:
+                series.prompt_tokens.observe(prompt_tokens)
+            if response_tokens:
+                series.response_tokens.observe(response_tokens)
+
+            self.recent.append({
+                "at": time.strftime("%H:%M:%S"), "operation": operation, "outcome": outcome,
+                "seconds": round(seconds, 3), "retries": retries, "key": suffix, "model": model,
+                "prompt_tokens": prompt_tokens, "response_tokens": response_tokens,
+                "error": str(error)[:80] if error else None,
+            })
+        self.flush()
+
+    def record_stage(self, stage, seconds, outcome):
+        with self._lock:
+            outcomes, latency = self._stages.setdefault(stage, ({}, Histogram(LATENCY_BUCKETS)))
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            latency.observe(seconds)
+        self.flush()
+
+    def rows(self):
+        """One summary row per (operation, model, key), for the admin panel."""
+        with self._lock:
+            rows = []
+            for (operation, model, suffix), s in sorted(self._series.items(), key=lambda kv: str(kv[0])):
+                ok = s.outcomes.get("ok", 0)
+                rows.append({
+                    "operation": operation,
+                    "model": model,
+                    "key": suffix,
+                    "calls": s.latency.count,
+                    "errors": s.latency.count - ok,
+                    "retries": s.retries,
+                    "p50_s": s.latency.quantile(0.5),
+                    "p95_s": s.latency.quantile(0.95),
+                    "avg_s": round(s.latency.mean(), 3),
+                    "avg_prompt_tok": round(s.prompt_tokens.mean() or 0),
+                    "avg_response_tok": round(s.response_tokens.mean() or 0),
+                })
+            return rows
+
+    def stage_rows(self):
+        with self._lock:
+            return [{
+                "stage": stage,
+                "count": latency.count,
+                "p50_s": latency.quantile(0.5),
+                "p95_s": latency.quantile(0.95),
+                "outcomes": ", ".join(f"{k}: {v}" for k, v in sorted(outcomes.items())),
+            } for stage, (outcomes, latency) in sorted(self._stages.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "written_at": time.time(),
+                "calls": [
+                    {"operation": op, "model": model, "key": suffix, **s.to_dict()}
+                    for (op, model, suffix), s in self._series.items()
+                ],
+                "stages": {
+                    stage: {"outcomes": dict(outcomes), "latency_seconds": latency.to_dict()}
+                    for stage, (outcomes, latency) in self._stages.items()
+                },
+            }
+
+    def flush(self, force=False):
+        """Writes the snapshot to the metrics file (atomically) if the flush interval has passed."""
+        if not self.path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not write LLM metrics: {e}")
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._stages.clear()
+            self.recent.clear()
+            self.started_at = time.time()
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+import config
+
+
+class HintPrefetcher:
+    """
+    Generates opening Socratic questions in the background so the warm-up chat
+    can show one immediately. Work is grouped by owner (the tutoring session id)
+    and can be cancelled when the user moves on.
+    """
+
+    def __init__(self, generate, max_workers=config.PREFETCH_WORKERS, max_entries=config.PREFETCH_MAX_ENTRIES):
+        # generate(prompt) -> str; runs on worker threads, so it must not touch st.session_state
+        self.generate = generate
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hint-prefetch")
+        self._jobs = OrderedDict()  # (owner, snippet_id) -> (Future, cancel Event)
+        self._lock = threading.Lock()
+
+    def _run(self, prompt, cancelled):
+        if cancelled.is_set():
+            return None
+        try:
+            return self.generate(prompt)
+        except Exception as e:
+            print(f"⚠️ Hint prefetch failed: {str(e)[:50]}")
+            return None
+
+    def prefetch(self, owner, prompts):
+        """Starts generating `prompts` ({snippet_id: prompt}) for this owner; drops its other jobs."""
+        with self._lock:
+            for key in [k for k in self._jobs if k[0] == owner and k[1] not in prompts]:
+                self._drop(key)
+
+            for snippet_id, prompt in prompts.items():
+                if (owner, snippet_id) in self._jobs:
+                    continue
+                cancelled = threading.Event()
+                future = self._executor.submit(self._run, prompt, cancelled)
+                self._jobs[(owner, snippet_id)] = (future, cancelled)
+
+            # Abandoned sessions never cancel: forget their oldest jobs
+            while len(self._jobs) > self.max_entries:
+                self._drop(next(iter(self._jobs)))
+
+    def take(self, owner, snippet_id, timeout=0):
+        """
+        Returns the prefetched question (and forgets it), waiting up to `timeout`
+        seconds for it to finish. Returns None if it isn't ready or failed.
+        """
+        with self._lock:
+            job = self._jobs.get((owner, snippet_id))
+        if not job:
+            return None
+
+        try:
+            result = job[0].result(timeout=timeout)
+        except (FutureTimeout, CancelledError):
+            return None
+
+        with self._lock:
+            self._jobs.pop((owner, snippet_id), None)
+        return result
+
+    def cancel(self, owner):
+        with self._lock:
+            for key in [k for k in self._jobs if k[0] == owner]:
+                self._drop(key)
+
+    def _drop(self, key):
+        future, cancelled = self._jobs.pop(key)
+        cancelled.set()
+        future.cancel()
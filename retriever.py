@@ -1,8 +1,5 @@
 import json
-import numpy as np
-import torch
 import os
-from sentence_transformers import SentenceTransformer, util
 from ast_analyzer import analyze_code_structure
 from taxonomy import get_common_ancestor
 import config
@@ -47,6 +44,11 @@ class CodeRetriever:
         if self.model is None:
             print(f"⏳ Loading Heavy Assets ({config.EMBEDDING_MODEL_NAME})...")
             try:
+                # torch and sentence_transformers take seconds to import; only pay for it here
+                import numpy as np
+                import torch
+                from sentence_transformers import SentenceTransformer
+
                 self.model = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
 
                 if os.path.exists(config.EMBEDDING_PATH):
@@ -77,6 +79,7 @@ class CodeRetriever:
         is_syntax_error = "Syntax" in user_features
 
         # Convert user code to vector
+        from sentence_transformers import util
         query_embedding = self.model.encode(user_code, convert_to_tensor=True)
         cos_scores = util.cos_sim(query_embedding, self.tensor_embeddings)[0]
 
@@ -0,0 +1,167 @@
+import atexit
+import json
+import queue
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import config
+
+# Source of a single-use worker. It is started ahead of time, applies its
+# resource limits, then blocks on stdin until a job arrives. The report goes
+# out on a private copy of stdout: the fix's code only sees a null stdout, and
+# the parent only accepts a report that carries the job's nonce.
+WORKER_SOURCE = r'''
+import contextlib, io, json, os, sys
+
+cpu_seconds, memory_mb = int(sys.argv[1]), int(sys.argv[2])
+try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+except (ImportError, ValueError, OSError):
+    pass  # Windows: the parent's wall-clock timeout still applies
+
+job = json.loads(sys.stdin.read())
+nonce = job.pop("nonce")
+sys.stdin = io.StringIO("")
+report_fd = os.dup(1)
+devnull = os.open(os.devnull, os.O_WRONLY)
+os.dup2(devnull, 1)
+os.close(devnull)
+
+
+def describe(exc):
+    message = str(exc)
+    return f"{type(exc).__name__}: {message}" if message else type(exc).__name__
+
+
+report = {"passed": False, "error": None, "results": []}
+namespace = {"__name__": "__main__"}
+buffer = io.StringIO()
+try:
+    with contextlib.redirect_stdout(buffer):
+        exec(compile(job["code"], "<fix>", "exec"), namespace)
+except BaseException as e:
+    report["error"] = describe(e)
+
+if report["error"] is None:
+    for test in job["tests"]:
+        namespace["_output"] = buffer.getvalue()
+        try:
+            with contextlib.redirect_stdout(buffer):
+                exec(compile(test, "<test>", "exec"), namespace)
+            report["results"].append({"test": test, "passed": True, "error": None})
+        except BaseException as e:
+            report["results"].append({"test": test, "passed": False, "error": describe(e)})
+    report["passed"] = all(r["passed"] for r in report["results"])
+
+report["nonce"] = nonce
+os.write(report_fd, ("\n" + json.dumps(report) + "\n").encode())
+'''
+
+
+class SandboxPool:
+    """
+    Runs user code against snippet test cases in isolated subprocesses.
+    Workers are spawned ahead of time and used for exactly one job, so a
+    fix can never leak state into the next one.
+    """
+
+    def __init__(self, size=config.SANDBOX_POOL_SIZE):
+        self.size = size
+        self.work_dir = tempfile.mkdtemp(prefix="tutor_sandbox_")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for _ in range(size):
+            self._idle.put(self._spawn())
+        atexit.register(self.close)
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [sys.executable, "-I", "-c", WORKER_SOURCE,
+             str(config.SANDBOX_CPU_SECONDS), str(config.SANDBOX_MEMORY_MB)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.work_dir,
+            text=True,
+        )
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            # Pool exhausted under load: pay the spawn cost inline
+            return self._spawn()
+
+    def _replenish(self):
+        with self._lock:
+            if not self._closed and self._idle.qsize() < self.size:
+                self._idle.put(self._spawn())
+
+    def run_tests(self, code, tests, timeout=config.SANDBOX_TIMEOUT):
+        """
+        Executes `code`, then every test statement in the same namespace.
+        Everything printed so far is available to each test as `_output`.
+        Returns a report dict: passed, error, results, elapsed_ms.
+        """
+        start = time.perf_counter()
+        nonce = secrets.token_hex(16)
+        proc = self._acquire()
+        try:
+            out, _ = proc.communicate(json.dumps({"code": code, "tests": tests, "nonce": nonce}), timeout=timeout)
+            lines = [line for line in out.splitlines() if line.strip()]
+            report = json.loads(lines[-1]) if lines else None
+            if not isinstance(report, dict):
+                raise ValueError
+            if report.pop("nonce", None) != nonce:
+                # Written by the fix's code rather than the worker
+                report = {"passed": False, "error": "The sandbox report was not valid.", "results": []}
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            report = {"passed": False, "error": f"Timed out after {timeout}s (infinite loop?)", "results": []}
+        except (ValueError, IndexError):
+            # Worker died without a report: CPU or memory limit, or os._exit
+            report = {"passed": False, "error": "Stopped by the CPU/memory limit (infinite loop?)", "results": []}
+        finally:
+            threading.Thread(target=self._replenish, daemon=True).start()
+
+        report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return report
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while not self._idle.empty():
+            proc = self._idle.get_nowait()
+            proc.kill()
+            proc.communicate()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def is_conclusive(report):
+    """
+    False for a report that stopped before any test ran (timeout, CPU/memory limit,
+    missing report or an error in the code itself): under load it may not repeat.
+    """
+    return not (report.get("error") and not report.get("results"))
+
+
+def summarize_report(report):
+    """Short human-readable summary of a test report, used in prompts and fallbacks."""
+    if report.get("error"):
+        return report["error"]
+
+    failed = [r for r in report.get("results", []) if not r["passed"]]
+    if not failed:
+        return f"All {len(report.get('results', []))} tests passed."
+    first = failed[0]
+    return f"{len(failed)} test(s) failed. First failure: `{first['test']}` -> {first['error']}"
@@ -1,3 +1,5 @@
+import re
+
 ERROR_TAXONOMY = {
     "Root": ["Logic_Errors", "Syntax_Errors", "Runtime_Errors"],
 
@@ -31,4 +33,202 @@ def get_common_ancestor(error_list):
     if len(parents) == 1:
         return list(parents)[0]
 
-    return "Root"
\ No newline at end of file
+    return "Root"
+
+
+# Taxonomy node of every error type in data/error_database.json
+ERROR_TYPE_NODES = {
+    # Syntax
+    "Missing_Indent": "Indentation",
+    "Unexpected_Indent": "Indentation",
+    "Indentation_Error": "Indentation",
+    "Undefined_Variable": "Typos",
+    "Misspelled_Identifier": "Typos",
+    "Missing_Colon": "Missing_Symbols",
+    "Bad_Parentheses": "Missing_Symbols",
+    "Unclosed_String": "Missing_Symbols",
+    "Mismatched_Quotes": "Missing_Symbols",
+    "Single_Tuple_Parentheses": "Missing_Symbols",
+    "Syntax_In_Comprehension": "Syntax_Errors",
+    "Default_Args_Order": "Syntax_Errors",
+    "Increment_Operator_Confusion": "Syntax_Errors",
+
+    # Loops
+    "Infinite_Loop": "Infinite_Loop",
+    "Infinite_Loop_Missing_Increment": "Infinite_Loop",
+    "Continue_Placement": "Infinite_Loop",
+    "Off_By_One": "Off_By_One",
+    "Range_Index_Error": "Off_By_One",
+    "Index_Out_Of_Bounds": "Off_By_One",
+    "For_Else_Logic": "Loops",
+    "Modifying_List_While_Iterating": "List_Mutation",
+
+    # Conditionals
+    "Wrong_Comparison": "Incorrect_Comparison",
+    "Assignment_In_Condition": "Incorrect_Comparison",
+    "Small_Int_Caching": "Incorrect_Comparison",
+    "Misordered_Conditions": "Else_If_Order",
+    "Boolean_Casting": "Conditionals",
+    "Implicit_None_Return": "Conditionals",
+
+    # Recursion
+    "Missing_Base_Case": "Missing_Base_Case",
+    "Wrong_Recursive_Call": "Incorrect_Recursive_Call",
+    "Inefficient_Recursion": "Recursion",
+
+    # Data structures
+    "KeyError": "KeyError",
+    "Key_Error": "KeyError",
+    "Wrong_Key_Type": "KeyError",
+    "Dict_Iteration_Error": "Data_Structures",
+    "In_Place_Method_Return": "Data_Structures",
+    "Aliasing_Bug": "List_Mutation",
+    "Shallow_Copy_Bug": "List_Mutation",
+    "List_Mult_Reference": "List_Mutation",
+
+    # Runtime
+    "IndexError": "IndexError",
+    "IndexError_Empty_Seq": "IndexError",
+    "Type_Mismatch": "TypeError",
+    "Type_Error_Str_Int": "TypeError",
+    "String_Concatenation_Type": "TypeError",
+    "String_Immutability": "TypeError",
+    "Tuple_Assignment": "TypeError",
+    "Float_Indexing": "TypeError",
+    "Set_Indexing": "TypeError",
+    "Unhashable_Key": "TypeError",
+    "Dict_Get_None_Type": "TypeError",
+    "Iterator_Len_Error": "TypeError",
+    "Json_Dump_Load_Confusion": "TypeError",
+    "Arg_Count_Mismatch": "TypeError",
+    "Argument_Unpacking": "TypeError",
+    "Wrong_Constructor_Call": "TypeError",
+    "AttributeError": "Runtime_Errors",
+    "AttributeError_String": "Runtime_Errors",
+    "String_Method_Error": "Runtime_Errors",
+    "List_Attribute_Error": "Runtime_Errors",
+    "Private_Attribute_Access": "Runtime_Errors",
+    "Scope_Error": "Runtime_Errors",
+    "UnboundLocalError_Assignment": "Runtime_Errors",
+    "FileNotFound": "Runtime_Errors",
+    "Wrong_File_Mode": "Runtime_Errors",
+    "File_Mode_Mismatch": "Runtime_Errors",
+    "Domain_Error": "Runtime_Errors",
+    "StopIteration_Return": "Runtime_Errors",
+    "Wrong_Exception_Type": "Runtime_Errors",
+
+    # Logic that fits no narrower node
+    "Pass_Statement_Usage": "Logic_Errors",
+    "Else_Block_Misunderstanding": "Logic_Errors",
+    "Unreachable_Code": "Logic_Errors",
+    "Mutable_Default_Arg": "Logic_Errors",
+    "Mutable_Class_Attribute": "Logic_Errors",
+    "Missing_Super_Call": "Logic_Errors",
+    "Missing_Str_Method": "Logic_Errors",
+    "Decorator_Return_Error": "Logic_Errors",
+    "Generator_Logic_Error": "Logic_Errors",
+    "Late_Binding_Closure": "Logic_Errors",
+    "Float_Precision": "Logic_Errors",
+    "Rounding_Logic": "Logic_Errors",
+    "Regex_Special_Char": "Logic_Errors",
+    "Missing_File_Close": "Logic_Errors",
+}
+
+# Fallback for free text (syntax messages, topic names): every stem must start a word.
+# Specific entries come before generic ones.
+ERROR_KEYWORDS = [
+    (("infinite",), "Infinite_Loop"),
+    (("off", "one"), "Off_By_One"),
+    (("indent",), "Indentation"),
+    (("unindent",), "Indentation"),
+    (("base", "case"), "Missing_Base_Case"),
+    (("recurs",), "Recursion"),
+    (("range",), "For_Loop_Range"),
+    (("loop",), "Loops"),
+    (("comparison",), "Incorrect_Comparison"),
+    (("condition",), "Conditionals"),
+    (("keyerror",), "KeyError"),
+    (("indexerror",), "IndexError"),
+    (("typeerror",), "TypeError"),
+    (("zerodivisionerror",), "ZeroDivision"),
+    (("division", "zero"), "ZeroDivision"),
+    (("string", "literal"), "Missing_Symbols"),
+    (("never", "closed"), "Missing_Symbols"),
+    (("unmatched",), "Missing_Symbols"),
+    (("colon",), "Missing_Symbols"),
+    (("parenthes",), "Missing_Symbols"),
+    (("quote",), "Missing_Symbols"),
+    (("misspell",), "Typos"),
+    (("undefined",), "Typos"),
+    (("not", "defined"), "Typos"),
+    (("syntax",), "Syntax_Errors"),
+    (("list",), "Data_Structures"),
+    (("dict",), "Data_Structures"),
+]
+
+# Local Socratic questions, used when the LLM is too slow or unavailable.
+# "{name}" is replaced with the user's display name.
+QUESTION_TEMPLATES = {
+    "Loops": [
+        "{name}, what value does the loop variable have on each pass, and when does the condition become False?",
+        "{name}, try tracing the first three iterations by hand. What changes each time?",
+        "{name}, which line is supposed to move the loop toward its end?",
+    ],
+    "Off_By_One": [
+        "{name}, what are the first and last values your range produces, and which indexes actually exist?",
+        "{name}, does the loop start and stop exactly where the data does?",
+    ],
+    "Recursion": [
+        "{name}, what is the smallest input where the function should stop calling itself?",
+        "{name}, does every recursive call get closer to that stopping point?",
+        "{name}, what does the function return for the simplest possible input?",
+    ],
+    "Conditionals": [
+        "{name}, which branch runs for the example values, and is that the one you expected?",
+        "{name}, in that condition, are you comparing two values or assigning one?",
+        "{name}, if two conditions are both true, which branch wins?",
+    ],
+    "Data_Structures": [
+        "{name}, which indexes or keys actually exist in that collection?",
+        "{name}, what would you see if you printed the collection right before the failing line?",
+    ],
+    "Indentation": [
+        "{name}, which lines should belong to the block above them, and do they line up that way?",
+        "{name}, does each block start one level deeper than the line that opens it?",
+    ],
+    "Syntax_Errors": [
+        "{name}, read the line the error points to slowly. Is a colon, bracket or quote missing?",
+        "{name}, is every name spelled exactly the same way everywhere it is used?",
+    ],
+    "Runtime_Errors": [
+        "{name}, which line raises the error, and what are the values of its variables at that moment?",
+        "{name}, what type does each value have on the line that fails?",
+    ],
+    "Root": [
+        "{name}, what do you expect this code to do, and what does it actually do?",
+        "{name}, which single line are you least sure about?",
+    ],
+}
+
+
+def classify_error_type(error_type):
+    """Maps any error type string (database label or syntax message) to a taxonomy node."""
+    if error_type in PARENT_MAP or error_type in ERROR_TAXONOMY:
+        return error_type
+
+    if error_type in ERROR_TYPE_NODES:
+        return ERROR_TYPE_NODES[error_type]
+
+    words = re.findall(r"[a-z]+", (error_type or "").lower())
+    for stems, node in ERROR_KEYWORDS:
+        if all(any(word.startswith(stem) for word in words) for stem in stems):
+            return node
+    return "Root"
+
+
+def get_question_templates(error_type):
+    """Returns the question templates of the nearest taxonomy node that has some."""
+    node = classify_error_type(error_type)
+    while node not in QUESTION_TEMPLATES:
+        node = PARENT_MAP.get(node, "Root")
+    return QUESTION_TEMPLATES[node]
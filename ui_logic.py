@@ -1,15 +1,30 @@
 import streamlit as st
 import random
-import pandas as pd
-import plotly.express as px
-import google.generativeai as genai
 from retriever import CodeRetriever
+from sandbox import SandboxPool, is_conclusive, summarize_report
+from key_pool import KeyPool
+from llm_client import AsyncLLMClient
+from chat_history import ChatHistory, extractive_summary, format_turns
+from verdict_cache import VerdictCache
+from prefetch import HintPrefetcher
+from fallback import LocalTutor
+from metrics import LLMMetrics, token_counts
+from brain_status import BrainProbe
+from cohort import CohortStats
+from knowledge import KnowledgeTracer, fit_all
 import config
 import database
 import analytics
 import uuid
 import ast
-import itertools
+import queue
+import threading
+import time
+
+if config.FAKE_GEMINI:
+    import fake_gemini as genai
+else:
+    import google.generativeai as genai
 
 # Constant list of calibration code snippets
 CALIBRATION_TEST = [
@@ -18,28 +33,32 @@ CALIBRATION_TEST = [
         "topic": "Syntax",
         "code": "def greet(name)\n    print('Hello ' + name)",
         "hint": "Focus on the function definition line. Python requires a specific symbol at the end.",
-        "reward": {"Syntax": 2.0, "Logic": 1.0}
+        "reward": {"Syntax": 2.0, "Logic": 1.0},
+        "tests": ["greet('Ada')", "assert 'Hello Ada' in _output"]
     },
     {
         "id": "calib_02",
         "topic": "Loops",
         "code": "count = 0\nwhile count < 3:\n    print(count)",
         "hint": "This loop runs forever because the condition never becomes False. How do you change 'count'?",
-        "reward": {"Loops": 2.0, "Logic": 1.0}
+        "reward": {"Loops": 2.0, "Logic": 1.0},
+        "tests": ["assert _output.split() == ['0', '1', '2']"]
     },
     {
         "id": "calib_03",
         "topic": "Recursion",
         "code": "def fact(n):\n    return n * fact(n-1)",
         "hint": "Infinite recursion! You need a 'base case' to stop calling the function when n reaches 0 or 1.",
-        "reward": {"Recursion": 2.0, "Logic": 1.0}
+        "reward": {"Recursion": 2.0, "Logic": 1.0},
+        "tests": ["assert fact(1) == 1", "assert fact(5) == 120"]
     },
     {
         "id": "calib_04",
         "topic": "Conditionals",
         "code": "x = 10\nif x = 10:\n    print('Equal')",
         "hint": "In Python, a single '=' is for assignment. What do we use for comparison?",
-        "reward": {"Logic": 2.0, "Syntax": 1.0}
+        "reward": {"Logic": 2.0, "Syntax": 1.0},
+        "tests": ["assert _output.split() == ['Equal']"]
     },
     {
         "id": "calib_05",
@@ -52,43 +71,214 @@ CALIBRATION_TEST = [
 
 
 # Gemini and Retriever setup
-def get_next_api_key():
-    if "key_cycle" not in st.session_state:
-        st.session_state.key_cycle = itertools.cycle(config.GEMINI_KEYS)
-    return next(st.session_state.key_cycle)
+@st.cache_resource
+def load_key_pool():
+    return KeyPool(config.GEMINI_KEYS)
 
 
-def generate_content_with_rotation(prompt):
-    """Tries to generate content, rotating keys on failure."""
-    attempts = 0
-    max_attempts = len(config.GEMINI_KEYS)
+# Process-wide caches, shared by every session
+_genai_lock = threading.Lock()
+_model_catalog = {}  # api key -> (fetched_at, model names)
+_model_instances = {}  # (api key, model name) -> GenerativeModel
 
-    while attempts < max_attempts:
-        current_key = get_next_api_key()
-        try:
-            genai.configure(api_key=current_key)
-            models = [m.name for m in genai.list_models() if "generateContent" in m.supported_generation_methods]
 
-            models.sort(key=lambda x: "flash" in x.lower(), reverse=True)
+def get_models_for_key(key, refresh=False):
+    """Returns the generative models for a key (flash first), cached for MODEL_CATALOG_TTL seconds."""
+    cached = _model_catalog.get(key)
+    if not cached and not refresh and brain.models_for(key) is not None:
+        # Probed by this or another process at startup
+        cached = _model_catalog[key] = (brain.checked_at, brain.models_for(key))
+    if cached and not refresh and time.time() - cached[0] < config.MODEL_CATALOG_TTL:
+        return cached[1]
+
+    with _genai_lock:
+        genai.configure(api_key=key)
+        models = [m.name for m in genai.list_models() if "generateContent" in m.supported_generation_methods]
+
+    models.sort(key=lambda x: "flash" in x.lower(), reverse=True)
+    _model_catalog[key] = (time.time(), models)
+    return models
+
+
+def get_model_instance(key, model_name):
+    """
+    Returns a reusable GenerativeModel bound to the given key.
+    A model takes the configured key on its first request, so that request
+    (a cheap count_tokens) is made under the lock while this key is configured.
+    """
+    instance = _model_instances.get((key, model_name))
+    if instance is None:
+        with _genai_lock:
+            genai.configure(api_key=key)
+            instance = genai.GenerativeModel(model_name)
+            instance.count_tokens("ping")
+        _model_instances[(key, model_name)] = instance
+    return instance
+
+
+def call_gemini(key, prompt):
+    """One blocking generate_content call with the given key."""
+    models = get_models_for_key(key)
+    if not models:
+        raise Exception("No generative models found for this API key.")
+    return get_model_instance(key, models[0]).generate_content(prompt)
+
+
+@st.cache_resource
+def load_llm_client():
+    return AsyncLLMClient(load_key_pool(), call_gemini)
+
+
+@st.cache_resource
+def load_llm_metrics():
+    return LLMMetrics()
+
+
+def served_model(key):
+    """The model call_gemini / open_stream use for a key (from the catalog cache, no network)."""
+    cached = _model_catalog.get(key)
+    return cached[1][0] if cached and cached[1] else None
+
+
+def stream_with_release(client, key, start, first_chunk, chunks):
+    """
+    Yields a response stream and reports its outcome to the key pool when it ends,
+    then gives back the stream's slot in the client's concurrency cap.
+    A stream the consumer abandons (rerun, stop) frees the key without marking it healthy or failed.
+    """
+    try:
+        yield first_chunk
+        yield from chunks
+    except GeneratorExit:
+        client.pool.release(key, success=None)
+        raise
+    except Exception as e:
+        client.pool.release(key, success=False, error=e, latency=time.perf_counter() - start)
+        raise
+    else:
+        client.pool.release(key, success=True, latency=time.perf_counter() - start)
+    finally:
+        client.release_slot()
+
+
+def generate_content_with_rotation(prompt, operation="other"):
+    """
+    Tries to generate content, moving to the next healthy key on failure.
+    Calls go through the async client (concurrency cap, deadline, hedging).
+    Every call is recorded in the LLM metrics under `operation`.
+    """
+    return metered_generate(load_llm_client(), load_llm_metrics(), prompt, operation)
+
+
+def metered_generate(client, metrics, prompt, operation):
+    """client.generate_sync with wall time, retries, key, model, tokens and outcome recorded."""
+    trace = {}
+    start = time.perf_counter()
+    try:
+        response = client.generate_sync(prompt, trace=trace)
+    except Exception as e:
+        metrics.record_call(operation, time.perf_counter() - start, "error",
+                            retries=max(0, trace.get("attempts", 1) - 1),
+                            prompt_tokens=token_counts(prompt)[0], error=e)
+        raise
+
+    key = trace.get("key")
+    prompt_tokens, response_tokens = token_counts(prompt, response)
+    metrics.record_call(operation, time.perf_counter() - start, "ok", key=key, model=served_model(key),
+                        retries=max(0, trace.get("attempts", 1) - 1),
+                        prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+    return response
+
+
+def metered_stream(client, metrics, prompt, operation):
+    """open_stream, with the whole stream recorded in the metrics once it ends."""
+    trace = {}
+    start = time.perf_counter()
+    try:
+        chunks = open_stream(client, prompt, trace)
+    except Exception as e:
+        metrics.record_call(operation, time.perf_counter() - start, "error",
+                            retries=max(0, trace.get("attempts", 1) - 1),
+                            prompt_tokens=token_counts(prompt)[0], error=e)
+        raise
+    return metered_chunks(metrics, operation, prompt, trace, start, chunks)
+
+
+def metered_chunks(metrics, operation, prompt, trace, start, chunks):
+    parts, last, outcome, error = [], None, "error", None
+    try:
+        for chunk in chunks:
+            last = chunk
+            parts.append(chunk_text(chunk))
+            yield chunk
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        chunks.close()  # Frees the key now rather than when the stream is garbage collected
+        raise
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        prompt_tokens, response_tokens = token_counts(prompt, last, "".join(parts))
+        metrics.record_call(operation, time.perf_counter() - start, outcome,
+                            key=trace.get("key"), model=trace.get("model"),
+                            retries=max(0, trace.get("attempts", 1) - 1),
+                            prompt_tokens=prompt_tokens, response_tokens=response_tokens,
+                            first_chunk=trace["first_chunk_at"] - start, error=error)
+
+
+def open_stream(client, prompt, trace=None):
+    """
+    Starts a streamed generation on the first healthy key that sends a chunk.
+    The stream holds one of the client's concurrency slots until it ends or is abandoned,
+    so LLM_MAX_CONCURRENCY bounds streamed and plain calls together.
+    Fills `trace` with the keys tried, and the key, model and arrival time of the first chunk.
+    """
+    trace = {} if trace is None else trace
+    if not client.acquire_slot():
+        raise Exception("No free LLM slot.")
+    try:
+        return open_stream_on_slot(client, prompt, trace)
+    except BaseException:
+        client.release_slot()
+        raise
+
+
+def open_stream_on_slot(client, prompt, trace):
+    pool = client.pool
+    tried = set()
+
+    while len(tried) < len(pool.keys):
+        current_key = pool.acquire(exclude=tried)
+        if current_key is None:
+            break
+        tried.add(current_key)
+        trace["attempts"] = len(tried)
+
+        start = time.perf_counter()
+        try:
+            models = get_models_for_key(current_key)
             if not models:
                 raise Exception("No generative models found for this API key.")
 
-            target_model_name = models[0]
-
-            model = genai.GenerativeModel(target_model_name)
-            response = model.generate_content(prompt)
-            return response
+            model = get_model_instance(current_key, models[0])
+            chunks = iter(model.generate_content(prompt, stream=True))
+            first_chunk = next(chunks)
+            trace.update(key=current_key, model=models[0], first_chunk_at=time.perf_counter())
+            return stream_with_release(client, current_key, start, first_chunk, chunks)
 
         except Exception as e:
+            pool.release(current_key, success=False, error=e)
             print(f"⚠️ Key failed: {str(e)[:50]}... Rotation to next.")
-            attempts += 1
 
     raise Exception("All API keys failed.")
 
 
 def configure_gemini():
     """
-    Tries to find at least one working key at startup.
+    Tries keys until one works and caches its model catalog. Runs on the brain probe thread.
+    The other keys are probed lazily, the first time the pool hands them out.
     Returns: (True, model_name) if any key works, else (False, None).
     """
     if not hasattr(config, 'GEMINI_KEYS') or not config.GEMINI_KEYS:
@@ -97,9 +287,7 @@ def configure_gemini():
     # Try every key until one works
     for key in config.GEMINI_KEYS:
         try:
-            genai.configure(api_key=key)
-            models = [m.name for m in genai.list_models() if "generateContent" in m.supported_generation_methods]
-            models.sort(key=lambda x: "flash" in x.lower(), reverse=True)
+            models = get_models_for_key(key, refresh=True)
             if models:
                 print(f"✅ Startup Success with key ending in ...{key[-4:]}")
                 return True, models[0]
@@ -117,7 +305,41 @@ def load_cached_retriever():
     return CodeRetriever()
 
 
-HAS_GEMINI, MODEL_NAME = configure_gemini()
+@st.cache_resource
+def load_sandbox_pool():
+    return SandboxPool()
+
+
+@st.cache_resource
+def load_verdict_cache():
+    return VerdictCache()
+
+
+@st.cache_resource
+def load_cohort_stats():
+    return CohortStats()
+
+
+@st.cache_resource
+def load_knowledge_tracer():
+    return KnowledgeTracer()
+
+
+def probe_gemini():
+    ok, model_name = configure_gemini()
+    models = {k: _model_catalog[k][1] for k in config.GEMINI_KEYS if isinstance(k, str) and k in _model_catalog}
+    return ok, model_name, models
+
+
+# Key probing runs in the background; until it finishes the tutor answers locally
+brain = BrainProbe(probe_gemini, config.GEMINI_KEYS)
+brain.start()
+
+
+def has_gemini():
+    return brain.state == "online"
+
+
 try:
     retriever = load_cached_retriever()
 except Exception as e:
@@ -126,7 +348,8 @@ except Exception as e:
 
 
 # Helper functions
-def get_player_profile(skills):
+def get_player_profile(skills, mastery=None):
+    """Level and title from the skill XP; with knowledge-tracing `mastery`, also the mastery estimate."""
     if not skills:
         return {"level": 0, "title": "Novice", "total_xp": 0}
 
@@ -148,11 +371,15 @@ def get_player_profile(skills):
     else:
         suffix = "Grandmaster"
 
-    return {
+    profile = {
         "level": level,
         "title": f"{best_skill} {suffix}",
         "total_xp": round(avg_xp, 1)
     }
+    if mastery:
+        profile["mastery"] = int(sum(mastery.values()) / len(mastery) * 100)
+        profile["mastered"] = [s for s, p in mastery.items() if p >= config.KT_MASTERY_THRESHOLD]
+    return profile
 
 
 def get_required_skill_for_topic(topic):
@@ -297,6 +524,25 @@ def top_header():
     st.write("")
 
 
+def render_brain_status():
+    state, model_name = brain.status()
+    if state == "online":
+        st.success(f"Brain: {model_name}")
+    elif state == "offline":
+        st.error("Brain: Offline")
+    else:
+        brain_status_checking()
+
+
+@st.fragment(run_every=1.0)
+def brain_status_checking():
+    # Polls until the background probe finishes, then reruns the whole page with the result
+    if brain.status()[0] == "checking":
+        st.info("Brain: Checking...")
+    else:
+        st.rerun()
+
+
 def render_sidebar():
     if st.session_state.get("logged_in") and st.session_state.get("user_id"):
         skills = database.get_user_skills(st.session_state.user_id)
@@ -327,6 +573,68 @@ def render_sidebar():
         if st.button("🚪 Logout", use_container_width=True):
             logout()
 
+        if st.session_state.get("username") in config.ADMIN_USERS:
+            render_admin_panel()
+
+
+def render_admin_panel():
+    """Sidebar tools for the accounts listed in config.ADMIN_USERS."""
+    with st.expander("🛠️ Admin"):
+        verdicts = load_verdict_cache()
+        st.caption("Judge verdict cache")
+        st.write(
+            f"Memory hits: {verdicts.stats['memory_hits']} | Disk hits: {verdicts.stats['disk_hits']} | "
+            f"Misses: {verdicts.stats['misses']} | Hit rate: {int(verdicts.hit_rate() * 100)}% | "
+            f"Stored: {database.count_cached_verdicts()}"
+        )
+        if st.button("🗑️ Purge verdict cache", use_container_width=True):
+            removed = verdicts.purge()
+            st.toast(f"Purged {removed} cached verdicts.")
+
+        import pandas as pd
+
+        metrics = load_llm_metrics()
+        st.caption("Gemini calls (p50/p95 are histogram bucket bounds, seconds)")
+        rows = metrics.rows()
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        else:
+            st.write("No calls yet.")
+
+        stages = metrics.stage_rows()
+        if stages:
+            st.caption("Tutor and judge response times")
+            st.dataframe(pd.DataFrame(stages), hide_index=True, use_container_width=True)
+
+        st.caption("API keys")
+        st.dataframe(pd.DataFrame(load_key_pool().stats()), hide_index=True, use_container_width=True)
+
+        if metrics.recent:
+            st.caption("Recent calls")
+            st.dataframe(pd.DataFrame(list(metrics.recent)[::-1]), hide_index=True, use_container_width=True)
+
+        if st.button("💾 Write metrics file", use_container_width=True):
+            metrics.flush(force=True)
+            st.toast(f"Metrics written to {metrics.path}")
+
+        if st.button("📊 Skill points earned by all students", use_container_width=True):
+            st.dataframe(pd.DataFrame([database.get_reward_totals()]), hide_index=True, use_container_width=True)
+
+        if st.button("📈 Rebuild my progress chart", use_container_width=True):
+            sessions = analytics.rebuild_progress(st.session_state.user_id)
+            progress_chart.clear()
+            st.toast(f"Progress rebuilt from {sessions} sessions.")
+
+        if st.button("🎓 Refit knowledge tracing", use_container_width=True):
+            with st.spinner("Fitting..."):
+                fitted = fit_all()
+            load_knowledge_tracer().reload()
+            st.toast(f"Fitted {len(fitted)} skills.")
+
+        if st.button("🔄 Re-check API keys", use_container_width=True):
+            brain.refresh()
+            st.rerun()
+
 
 def init_session():
     defaults = {
@@ -347,7 +655,8 @@ def init_session():
         "calib_attempts": 0,
         "calib_status": "active",
         "calib_feedback": None,
-        "calib_feedback_type": None
+        "calib_feedback_type": None,
+        "session_pages": 1
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -380,55 +689,304 @@ def clear_auth_fields():
         st.session_state.reg_display = ""
 
 
-def get_tutor_response(messages, user_code, context):
-    if not HAS_GEMINI:
-        return "⚠️ Offline Mode."
+def chunk_text(chunk):
+    """Text of a streamed chunk; chunks without text parts (e.g. safety stops) give ''."""
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
 
-    hist = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-    user_name = st.session_state.get("display_name", "you")
 
-    prompt = f"""
-                You are a Socratic Tutor for Python.
+def start_reply_stream(client, metrics, build_prompt, operation="tutor"):
+    """
+    Builds the prompt with build_prompt() and runs a streamed generation, both on a background thread.
+    Returns a queue of text chunks that ends with None, or with an exception and then None.
+    """
+    chunks = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in metered_stream(client, metrics, build_prompt(), operation):
+                text = chunk_text(chunk)
+                if text:
+                    chunks.put(text)
+        except Exception as e:
+            chunks.put(e)
+        chunks.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    return chunks
+
+
+def collect_reply(chunks, timeout):
+    """Joins the remaining chunks if the stream ends cleanly within `timeout` seconds, else None."""
+    deadline = time.monotonic() + timeout
+    parts = []
+    while True:
+        try:
+            item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            return None
+        if item is None:
+            return "".join(parts) or None
+        if isinstance(item, Exception):
+            return None
+        parts.append(item)
+
+
+@st.cache_resource
+def load_local_tutor():
+    return LocalTutor()
+
+
+def local_tutor_reply(messages, context):
+    """Reply built from local material: cached answers, taxonomy templates and the snippet hint."""
+    snippet = context.get("snippet") or {}
+    error_type = snippet.get("error_type") or context.get("concept") or "Root"
+    return load_local_tutor().reply(
+        messages, context.get("phase"), snippet.get("id", error_type), error_type,
+        hint=snippet.get("hint"), user_name=st.session_state.get("display_name") or "there"
+    )
+
+
+def remember_tutor_reply(context, reply):
+    snippet = context.get("snippet") or {}
+    error_type = snippet.get("error_type") or context.get("concept") or "Root"
+    load_local_tutor().remember(context.get("phase"), snippet.get("id", error_type), reply,
+                                user_name=st.session_state.get("display_name", ""))
 
-                Current Phase: {context.get('phase', 'Unknown')}
+
+def build_opening_prompt(snippet, user_name):
+    return f"""
+                You are a Socratic Tutor for Python.
                 Address the user by the name: "{user_name}"
 
-                User's Code:
+                Practice Example:
                 ```python
-                {user_code}
+                {snippet.get('code', '')}
                 ```
 
-                Chat History:
-                {hist}
+                The example contains this kind of bug: {snippet.get('error_type', 'Unknown')}
 
                 CRITICAL INSTRUCTIONS:
-                1. Address the user directly by their name ("{user_name}") — do NOT call them "you".
-                2. Be short (Max 2 sentences).
-                3. NEVER reveal the answer. Ask a guiding question.
-                4. NEVER use terms like "Root", "Taxonomy", "Node", or "Dataset".
-                5. If the user is wrong, ask them to check a specific logic concept (e.g., "Check how you are iterating").
+                1. Open the conversation with ONE short guiding question about the example.
+                2. NEVER reveal the bug or the answer.
+                3. NEVER use terms like "Root", "Taxonomy", "Node", or "Dataset".
                 """
 
-    try:
-        response = generate_content_with_rotation(prompt)
 
-        if response and response.text:
-            return response.text
-        return "I'm analyzing your code, but I couldn't generate a specific hint. Try rephrasing?"
+@st.cache_resource
+def load_hint_prefetcher():
+    client, metrics = load_llm_client(), load_llm_metrics()
+    return HintPrefetcher(
+        lambda prompt: (metered_generate(client, metrics, prompt, "prefetch").text or "").strip() or None
+    )
+
+
+def start_hint_prefetch():
+    """
+    Prefetches the opening question for the warm-up example on screen.
+    Only the opener is prefetched, and only while the chat is empty: it is the one
+    reply that doesn't depend on the conversation, and it is only shown before it starts.
+    """
+    analysis = st.session_state.get("analysis") or {}
+    candidates = analysis.get("warmup_candidates") or []
+    owner = st.session_state.get("current_session_id")
+    if not has_gemini() or not candidates or not owner:
+        return
+    if st.session_state.get("chat"):
+        load_hint_prefetcher().cancel(owner)
+        return
+
+    snippet = candidates[st.session_state.match_index % len(candidates)]
+    if "id" in snippet:
+        user_name = st.session_state.get("display_name", "you")
+        load_hint_prefetcher().prefetch(owner, {snippet["id"]: build_opening_prompt(snippet, user_name)})
+
+
+def cancel_hint_prefetch():
+    owner = st.session_state.get("current_session_id")
+    if has_gemini() and owner:
+        load_hint_prefetcher().cancel(owner)
+
+
+def summarize_chat(generate, previous_summary, turns):
+    """Folds older chat turns into the rolling summary used by ChatHistory. generate(prompt) -> response."""
+    prompt = f"""
+    Summarize this tutoring conversation in at most 3 sentences.
+    Keep what the student already tried, understood and is still stuck on.
+
+    Previous summary:
+    {previous_summary or "(none)"}
+
+    New turns:
+    {format_turns(turns)}
+    """
+
+    try:
+        res = generate(prompt)
+        text = (res.text or "").strip()
+        if text:
+            return text
     except Exception as e:
-        return f"AI Error: {str(e)}"
+        print(f"⚠️ Chat summary failed: {str(e)[:50]}")
+    return extractive_summary(previous_summary, turns)
+
+
+def tutor_prompt_builder(messages, user_code, context):
+    """
+    Returns a no-argument function that builds the tutor prompt.
+    Everything it needs from the session is read now, so it can run on the reply's
+    worker thread, where a summary call for older turns counts against the latency budget.
+    """
+    client, metrics = load_llm_client(), load_llm_metrics()
+    chat_history = ChatHistory(lambda previous, turns: summarize_chat(
+        lambda prompt: metered_generate(client, metrics, prompt, "summary"), previous, turns))
+    summary_cache = st.session_state.setdefault("chat_summary", {})
+    user_name = st.session_state.get("display_name", "you")
+    messages = list(messages)
+
+    def build():
+        # The user's code is always sent in full; only the chat is budgeted
+        hist = chat_history.build(messages, summary_cache)
+
+        prompt = f"""
+                    You are a Socratic Tutor for Python.
+
+                    Current Phase: {context.get('phase', 'Unknown')}
+                    Address the user by the name: "{user_name}"
+
+                    User's Code:
+                    ```python
+                    {user_code}
+                    ```
+
+                    Chat History:
+                    {hist}
+
+                    CRITICAL INSTRUCTIONS:
+                    1. Address the user directly by their name ("{user_name}") — do NOT call them "you".
+                    2. Be short (Max 2 sentences).
+                    3. NEVER reveal the answer. Ask a guiding question.
+                    4. NEVER use terms like "Root", "Taxonomy", "Node", or "Dataset".
+                    5. If the user is wrong, ask them to check a specific logic concept (e.g., "Check how you are iterating").
+                    """
+        return prompt
+
+    return build
+
+
+def render_tutor_reply(messages, user_code, context):
+    """
+    Writes the tutor's reply into the current chat message and appends it to `messages`.
+    If the phase's latency budget runs out before Gemini starts answering, a local
+    reply is shown at once and swapped for the LLM answer if that arrives within
+    TUTOR_LATE_ANSWER_GRACE seconds.
+    """
+    start = time.perf_counter()
+    metrics = load_llm_metrics()
+    fallback = local_tutor_reply(messages, context)
+    if not has_gemini():
+        st.write(fallback)
+        messages.append({"role": "assistant", "content": fallback})
+        metrics.record_stage("tutor", time.perf_counter() - start, "offline")
+        return
+
+    chunks = start_reply_stream(load_llm_client(), metrics, tutor_prompt_builder(messages, user_code, context))
+    budget = config.TUTOR_LATENCY_BUDGETS.get(context.get("phase"), config.TUTOR_LATENCY_BUDGET_DEFAULT)
 
+    try:
+        first = chunks.get(timeout=budget)
+    except queue.Empty:
+        first = queue.Empty
+
+    # Stage time is how long the student waited for the first visible words
+    waited = time.perf_counter() - start
 
-def ai_judge(original, fix, predicted_error):
+    if isinstance(first, str):
+        metrics.record_stage("tutor", waited, "llm")
+
+        def rest():
+            yield first
+            while True:
+                try:
+                    item = chunks.get(timeout=config.LLM_DEADLINE)
+                except queue.Empty:
+                    return
+                if not isinstance(item, str):
+                    return
+                yield item
+
+        reply = st.write_stream(rest())
+        remember_tutor_reply(context, reply)
+        messages.append({"role": "assistant", "content": reply})
+        return
+
+    if first is not queue.Empty:
+        # Gemini failed before sending anything
+        st.write(fallback)
+        messages.append({"role": "assistant", "content": fallback})
+        metrics.record_stage("tutor", waited, "error_fallback")
+        return
+
+    # Over budget: answer locally now, swap in the LLM answer if it is in time
+    placeholder = st.empty()
+    placeholder.write(fallback)
+    messages.append({"role": "assistant", "content": fallback})
+
+    status = st.empty()
+    status.caption("⏳ Still thinking...")
+    late = collect_reply(chunks, config.TUTOR_LATE_ANSWER_GRACE)
+    status.empty()
+
+    if late:
+        placeholder.write(late)
+        messages[-1]["content"] = late
+        remember_tutor_reply(context, late)
+    metrics.record_stage("tutor", waited, "late_llm" if late else "slow_fallback")
+
+
+def ai_judge(original, fix, predicted_error, tests=None):
+    start = time.perf_counter()
+    passed, msg, source = judge_fix(original, fix, predicted_error, tests)
+    load_llm_metrics().record_stage("judge", time.perf_counter() - start, source)
+    return passed, msg
+
+
+def judge_fix(original, fix, predicted_error, tests=None):
+    """Returns (passed, message, source) where source says what decided the verdict."""
     # Check for syntax errors
     try:
         ast.parse(fix)
     except SyntaxError as e:
-        return False, f"Syntax Error: {e.msg} at line {e.lineno}"
+        return False, f"Syntax Error: {e.msg} at line {e.lineno}", "syntax"
+
+    user_name = st.session_state.get("display_name", "")
+    verdicts = load_verdict_cache()
+    cached = verdicts.get(original, fix, predicted_error, user_name, tests)
+    if cached:
+        return cached[0], cached[1], "cached"
+
+    # Checkable snippets: the tests decide, the LLM only phrases feedback
+    cacheable = True
+    if tests:
+        passed, msg, cacheable = judge_with_tests(original, fix, predicted_error, tests)
+        source = "tests"
+    elif not has_gemini():
+        return False, "Offline Mode.", "offline"
+    else:
+        passed, msg = judge_with_llm(original, fix, predicted_error)
+        source = "llm"
+
+    if msg.startswith("AI Error"):
+        return passed, msg, "error"
+    if has_gemini() and cacheable:
+        verdicts.put(original, fix, predicted_error, user_name, passed, msg, tests)
+    return passed, msg, source
 
-    if not HAS_GEMINI:
-        return False, "Offline Mode."
 
+def judge_with_llm(original, fix, predicted_error):
+    """Asks Gemini whether the fix resolves the predicted error."""
     user_name = st.session_state.get("display_name", "you")
 
     prompt = f"""
@@ -458,7 +1016,7 @@ def ai_judge(original, fix, predicted_error):
     """
 
     try:
-        res = generate_content_with_rotation(prompt)
+        res = generate_content_with_rotation(prompt, operation="judge")
         text = (res.text or "").strip()
 
         if text.upper().startswith("YES"):
@@ -468,10 +1026,60 @@ def ai_judge(original, fix, predicted_error):
         return False, f"AI Error: {str(e)}"
 
 
+def judge_with_tests(original, fix, predicted_error, tests):
+    """
+    Runs the fix against the snippet's test cases in the sandbox.
+    Returns (passed, message, cacheable); a timeout or resource-limit stop is not cacheable.
+    """
+    report = load_sandbox_pool().run_tests(fix, tests)
+    passed = report["passed"]
+    cacheable = is_conclusive(report)
+    summary = summarize_report(report)
+    fallback = "All tests passed. Nice work!" if passed else summary
+
+    if not has_gemini():
+        return passed, fallback, cacheable
+
+    user_name = st.session_state.get("display_name", "you")
+
+    prompt = f"""
+    Act as a friendly Code Reviewer.
+    User Name: "{user_name}"
+
+    1. Original Buggy Code:
+    {original}
+
+    2. User's Fix:
+    {fix}
+
+    3. Target Error to Fix: {predicted_error}
+
+    4. AUTOMATED TESTS: {"PASSED" if passed else "FAILED"}
+    {summary}
+
+    INSTRUCTIONS:
+    - The test verdict is final. Do NOT contradict it.
+    - Write ONE short sentence of feedback addressed to the user by name.
+    - If the tests FAILED, give a specific hint. Do NOT give the answer code.
+    """
+
+    try:
+        res = generate_content_with_rotation(prompt, operation="judge")
+        text = (res.text or "").strip()
+        return passed, text or fallback, cacheable
+    except Exception:
+        return passed, fallback, cacheable
+
+
+@st.cache_data(max_entries=config.CHART_CACHE_ENTRIES, show_spinner=False)
 def plot_skill_spider(skills_dict):
+    """Radar chart of a skill vector (cached per vector, so unchanged skills skip plotly)."""
     if not skills_dict:
         return None
 
+    import pandas as pd
+    import plotly.express as px
+
     max_score = max(skills_dict.values()) if skills_dict else 0
     graph_limit = max(10, max_score + 2)
 
@@ -489,6 +1097,12 @@ def plot_skill_spider(skills_dict):
     return fig
 
 
+@st.cache_data(max_entries=config.CHART_CACHE_ENTRIES, show_spinner=False)
+def progress_chart(user_id, last_attempt_id):
+    """analytics.generate_progress_chart, rebuilt only once the user has logged a new attempt."""
+    return analytics.generate_progress_chart(user_id)
+
+
 def sync_user_profile():
     """
     Function fetches skills, call get_player_profile, and update st.session_state.experience.
@@ -619,7 +1233,7 @@ def render_calibration_page():
         with c1:
             if st.button("Check Answer", type="primary"):
                 with st.spinner("Analyzing..."):
-                    passed, msg = ai_judge(q["code"], user_fix, q["topic"])
+                    passed, msg = ai_judge(q["code"], user_fix, q["topic"], tests=q.get("tests"))
 
                     if passed:
                         st.session_state.calib_status = "success"
@@ -665,15 +1279,30 @@ def render_calibration_page():
     st.stop()
 
 
+def load_session_pages(user_id, pages):
+    """The user's newest `pages` pages of sessions, and the cursor of the page after them."""
+    sessions, cursor = [], None
+    for _ in range(pages):
+        page, cursor = database.get_user_sessions_page(user_id, before=cursor, limit=config.SESSION_PAGE_SIZE)
+        sessions += page
+        if cursor is None:
+            break
+    return sessions, cursor
+
+
 def render_dashboard():
+    cancel_hint_prefetch()
     render_sidebar()
 
-    skills = database.get_user_skills(st.session_state.user_id)
-    stats = database.get_user_stats(st.session_state.user_id)
-    user_sessions = database.get_user_sessions(st.session_state.user_id)
-    weak_topic = analytics.recommend_study_topic(st.session_state.user_id)
+    # One session (and a consistent snapshot) for all of the dashboard's reads
+    with database.unit_of_work(st.session_state.user_id):
+        skills = database.get_user_skills(st.session_state.user_id)
+        stats = database.get_user_stats(st.session_state.user_id)
+        user_sessions, older_cursor = load_session_pages(st.session_state.user_id, st.session_state.session_pages)
+        mastery = load_knowledge_tracer().mastery(st.session_state.user_id)
+        weak_topic = analytics.recommend_study_topic(st.session_state.user_id, mastery)
 
-    profile = get_player_profile(skills)
+    profile = get_player_profile(skills, mastery)
 
     # Update sidebar
     st.session_state.experience = f"Lvl {profile['level']} | {profile['title']}"
@@ -681,6 +1310,9 @@ def render_dashboard():
     # Display level & title
     st.markdown(f"### 🛡️ **Level {profile['level']}** — *{profile['title']}*")
     st.caption(f"Total XP: {profile['total_xp']}")
+    if "mastery" in profile:
+        mastered = f" · Mastered: {', '.join(profile['mastered'])}" if profile["mastered"] else ""
+        st.caption(f"🎓 Mastery estimate: {profile['mastery']}%{mastered}")
 
     # Top stats
     c1, c2, c3 = st.columns(3)
@@ -699,7 +1331,7 @@ def render_dashboard():
 
     # Progress graph section
     st.markdown("### 📈 Learning Progress")
-    prog_fig = analytics.generate_progress_chart(st.session_state.user_id)
+    prog_fig = progress_chart(st.session_state.user_id, database.get_last_attempt_id(st.session_state.user_id))
     if prog_fig:
         st.plotly_chart(prog_fig, use_container_width=True)
     else:
@@ -751,14 +1383,8 @@ def render_dashboard():
                         f"{s['status']} | {s['timestamp'].strftime('%b %d %H:%M')} | {s['attempts_count']} tries"):
                     st.caption(f"Session ID: {s['session_id']}")
 
-                    # Calculate & Display session gains
-                    hist = database.get_session_history(s['session_id'])
-                    session_gains = {}
-
-                    for h in hist:
-                        if h.get('rewards'):
-                            for k, v in h['rewards'].items():
-                                session_gains[k] = session_gains.get(k, 0) + v
+                    # Display session gains
+                    session_gains = s['gains']
 
                     if session_gains:
                         gains_str = ", ".join([f"+{v} {k}" for k, v in session_gains.items()])
@@ -766,17 +1392,24 @@ def render_dashboard():
 
                     st.code(s['initial_code'], language="python")
 
-                    for h in hist:
-                        icon = "✅" if h['success'] else "❌"
-                        st.text(f"{icon} {h['time']} - {h['code'][:30]}...")
+                    # Attempts are only loaded for the sessions the student opens
+                    if st.toggle("Show attempts", key=f"hist_{s['session_id']}"):
+                        for h in database.get_session_history(s['session_id']):
+                            icon = "✅" if h['success'] else "❌"
+                            st.text(f"{icon} {h['time']} - {h['code'][:30]}...")
 
                     if "Unsolved" in s['status']:
                         if st.button("↩️ Resume Session", key=f"btn_{s['session_id']}"):
+                            hist = database.get_session_history(s['session_id'])
                             last_code = hist[-1]['code'] if hist else s['initial_code']
                             st.session_state.user_code = last_code
                             st.session_state.current_session_id = s['session_id']
                             st.session_state.step = 3
                             st.rerun()
+
+            if older_cursor and st.button("⬇️ Load older sessions", use_container_width=True):
+                st.session_state.session_pages += 1
+                st.rerun()
         else:
             st.info("No sessions yet.")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -785,6 +1418,7 @@ def render_dashboard():
 
 
 def render_training_page():
+    cancel_hint_prefetch()
     render_sidebar()
 
     topic = st.session_state.get("training_topic", "General")
@@ -811,8 +1445,8 @@ def render_training_page():
             st.warning(f"No unlocked problems found for {topic}. Showing General Novice problems.")
             candidates = [s for s in all_snippets if s.get('difficulty') == 'Novice'][:5]
 
-        # Store fixed pool
-        st.session_state.training_pool = random.sample(candidates, min(3, len(candidates)))
+        # Store fixed pool, easiest first for the cohort
+        st.session_state.training_pool = load_cohort_stats().order(random.sample(candidates, min(3, len(candidates))))
         st.session_state.last_topic = topic
 
     # Display options
@@ -830,6 +1464,10 @@ def render_training_page():
                 lock_msg = f"{snippet.get('difficulty')} Level"
 
                 st.caption(f"Diff: {snippet.get('difficulty', 'Novice')}")
+                cohort = load_cohort_stats().lookup("snippet", snippet.get("id"))
+                if cohort and cohort["attempts"]:
+                    tries = f" · usually {cohort['median_attempts']} tries" if cohort["median_attempts"] else ""
+                    st.caption(f"👥 {int(cohort['success_rate'] * 100)}% of fixes pass{tries}")
                 st.write("")
 
             if is_locked:
@@ -926,9 +1564,17 @@ def render_step1_analyze():
                     valid_candidates = [s for s in all_snips if
                                         s.get('difficulty') == 'Novice' and s.get('topic') == fallback_topic][:3]
 
+                # Easiest first when the cohort has data on them, otherwise a random start
+                cohort = load_cohort_stats()
+                if any(cohort.success_rate(s) is not None for s in valid_candidates):
+                    valid_candidates = cohort.order(valid_candidates)
+                    st.session_state.match_index = 0
+                else:
+                    st.session_state.match_index = random.randint(0, len(valid_candidates) - 1) if valid_candidates else 0
+
                 result["warmup_candidates"] = valid_candidates
                 st.session_state.analysis = result
-                st.session_state.match_index = random.randint(0, len(valid_candidates) - 1) if valid_candidates else 0
+                start_hint_prefetch()
                 st.session_state.step = 2
                 st.rerun()
 
@@ -974,6 +1620,7 @@ def render_step2_warmup():
             if len(candidates) > 1:
                 if st.button("🔄 Different Example"):
                     st.session_state.match_index += 1
+                    start_hint_prefetch()
                     st.rerun()
             else:
                 st.button("🔄 Different Example", disabled=True, help="No other examples available.")
@@ -989,6 +1636,16 @@ def render_step2_warmup():
         st.subheader("Chat Tutor")
 
         chat_cont = st.container(height=420)
+
+        # Open with the prefetched Socratic question (already running since step 1)
+        if not st.session_state.chat and has_gemini() and "id" in match:
+            with chat_cont:
+                with st.spinner("Preparing a question..."):
+                    opener = load_hint_prefetcher().take(st.session_state.get("current_session_id"), match["id"],
+                                                         timeout=config.PREFETCH_WAIT)
+            if opener:
+                st.session_state.chat.append({"role": "assistant", "content": opener})
+
         with chat_cont:
             for m in st.session_state.chat:
                 with st.chat_message(m["role"]): st.write(m["content"])
@@ -998,16 +1655,16 @@ def render_step2_warmup():
             with chat_cont:
                 with st.chat_message("user"): st.write(prompt)
 
-            resp = get_tutor_response(st.session_state.chat, match.get("code", ""),
-                                      {"phase": "Warmup", "concept": detected})
-            st.session_state.chat.append({"role": "assistant", "content": resp})
             with chat_cont:
-                with st.chat_message("assistant"): st.write(resp)
+                with st.chat_message("assistant"):
+                    render_tutor_reply(st.session_state.chat, match.get("code", ""),
+                                       {"phase": "Warmup", "concept": detected, "snippet": match})
 
         st.markdown("</div>", unsafe_allow_html=True)
 
 
 def render_step3_fix():
+    cancel_hint_prefetch()
     render_sidebar()
     if st.button("⬅️ Dashboard"):
         st.session_state.step = "dashboard"
@@ -1049,20 +1706,28 @@ def render_step3_fix():
             with chat_cont:
                 with st.chat_message("user"):
                     st.write(prompt)
-            resp = get_tutor_response(st.session_state.chat, new_code, {"phase": "Fixing"})
-            st.session_state.chat.append({"role": "assistant", "content": resp})
+            top_match = st.session_state.analysis.get("top_match") if st.session_state.analysis else None
             with chat_cont:
                 with st.chat_message("assistant"):
-                    st.write(resp)
+                    render_tutor_reply(st.session_state.chat, new_code, {"phase": "Fixing", "snippet": top_match})
         st.markdown("</div>", unsafe_allow_html=True)
 
     if submit_clicked:
         with st.spinner("AI Judge is verifying..."):
             top_error = "Unknown"
+            snippet_id = "USER_INPUT"
+            tests = None
             if st.session_state.analysis and "top_match" in st.session_state.analysis:
                 top_error = st.session_state.analysis["top_match"]["error_type"]
 
-            passed, reason = ai_judge(st.session_state.user_code, new_code, top_error)
+                # The snippet id and its tests only apply when the user is fixing that exact snippet;
+                # their own code is logged as USER_INPUT, with the matched error type
+                snippet = st.session_state.analysis["top_match"]
+                if snippet.get("code", "").strip() == st.session_state.user_code.strip():
+                    snippet_id = snippet.get("id", snippet_id)
+                    tests = snippet.get("tests")
+
+            passed, reason = ai_judge(st.session_state.user_code, new_code, top_error, tests=tests)
 
             rewards_to_log = {}
             if passed:
@@ -1082,22 +1747,30 @@ def render_step3_fix():
                     if "Syntax" in detected or "Indentation" in detected: rewards_to_log["Syntax"] = 1.0
                     if "Data" in detected or "List" in detected: rewards_to_log["Data_Structures"] = 1.0
 
-            database.log_attempt(
-                st.session_state.user_id,
-                "USER_INPUT",
-                new_code,
-                passed,
-                st.session_state.get("current_session_id"),
-                rewards=rewards_to_log
-            )
+            # The attempt and the skill points it earned are committed together, after the
+            # session's buffered step 1 attempt so that one keeps the lower id
+            with database.unit_of_work(st.session_state.user_id, st.session_state.get("current_session_id")):
+                database.log_attempt(
+                    st.session_state.user_id,
+                    snippet_id,
+                    new_code,
+                    passed,
+                    st.session_state.get("current_session_id"),
+                    rewards=rewards_to_log,
+                    error_type=None if top_error == "Unknown" else top_error
+                )
+                if rewards_to_log:
+                    database.increment_user_skills(st.session_state.user_id, rewards_to_log)
+                load_knowledge_tracer().record(
+                    st.session_state.user_id,
+                    snippet_id,
+                    None if top_error == "Unknown" else top_error,
+                    passed
+                )
 
         if passed:
             st.balloons()
             st.success(f"✅ {reason}")
-
-            curr = database.get_user_skills(st.session_state.user_id)
-            new_skills = {k: curr.get(k, 0) + rewards_to_log.get(k, 0) for k in curr}
-            database.update_user_skills(st.session_state.user_id, new_skills)
         else:
             st.error(f"❌ {reason}")
 
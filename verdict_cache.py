@@ -0,0 +1,97 @@
+import ast
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+import config
+import database
+
+NAME_PLACEHOLDER = "<<USER_NAME>>"
+
+
+def canonicalize_code(code):
+    """
+    Canonical form of a code string, so formatting and comments don't change the key.
+    Code that doesn't parse (e.g. the original buggy code) is whitespace-normalized instead.
+    """
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        lines = [line.rstrip() for line in code.replace("\t", "    ").splitlines()]
+        return "\n".join(line for line in lines if line.strip())
+
+
+def make_key(original, fix, predicted_error, tests=None):
+    """Cache key. `tests` is part of it: a test-decided verdict is never served as an LLM one, or the reverse."""
+    tests_hash = hashlib.sha256("\0".join(tests).encode()).hexdigest() if tests else "-"
+    raw = "\0".join([canonicalize_code(original), canonicalize_code(fix), str(predicted_error), tests_hash])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class VerdictCache:
+    """
+    Two-level cache for judge verdicts: an in-memory LRU in front of the
+    judge_verdicts table. Messages are stored with the user's name replaced
+    by a placeholder so a cached verdict can be shown to anyone.
+    """
+
+    def __init__(self, max_size=config.VERDICT_CACHE_SIZE, ttl=config.VERDICT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lru = OrderedDict()  # key -> (stored_at, passed, message)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, original, fix, predicted_error, user_name, tests=None):
+        key = make_key(original, fix, predicted_error, tests)
+        user_name = user_name or "there"
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry and time.time() - entry[0] < self.ttl:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1], entry[2].replace(NAME_PLACEHOLDER, user_name)
+
+        cached = database.get_cached_verdict(key, self.ttl)
+        with self._lock:
+            if cached is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            # Keep the stored time, so the entry expires when its disk row does
+            passed, message, stored_at = cached
+            self._remember(key, passed, message, stored_at)
+        return passed, message.replace(NAME_PLACEHOLDER, user_name)
+
+    def put(self, original, fix, predicted_error, user_name, passed, message, tests=None):
+        key = make_key(original, fix, predicted_error, tests)
+        if user_name and len(user_name.strip()) > 1:
+            message = re.sub(rf"\b{re.escape(user_name.strip())}\b", NAME_PLACEHOLDER, message)
+
+        database.save_cached_verdict(key, passed, message)
+        with self._lock:
+            self._remember(key, passed, message)
+
+    def _remember(self, key, passed, message, stored_at=None):
+        self._lru[key] = (time.time() if stored_at is None else stored_at, passed, message)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def purge(self, older_than_seconds=None):
+        """Admin purge of both levels. Returns the number of rows removed from disk."""
+        with self._lock:
+            if older_than_seconds is None:
+                self._lru.clear()
+            else:
+                cutoff = time.time() - older_than_seconds
+                for key in [k for k, v in self._lru.items() if v[0] < cutoff]:
+                    del self._lru[key]
+        return database.purge_cached_verdicts(older_than_seconds)